@@ -2,9 +2,12 @@
 Check which Qwen models are cached
 """
 
-import os
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent / 'hybrid_llm'))
+from model_manifest import ModelManifest
+
 cache_dir = Path.home() / '.cache' / 'huggingface' / 'hub'
 
 print("=" * 70)
@@ -17,7 +20,8 @@ if not cache_dir.exists():
     print("❌ Cache directory doesn't exist")
     print("No models downloaded yet")
 else:
-    models = list(cache_dir.glob('models--Qwen*'))
+    manifest = ModelManifest(cache_dir)
+    models = manifest.cached_models()
     
     if not models:
         print("❌ No Qwen models found")
@@ -26,22 +30,22 @@ else:
         print("✅ Found models:")
         print()
         
-        for model_dir in models:
-            model_name = model_dir.name.replace('models--', '').replace('--', '/')
-            
-            # Calculate size
-            total_size = sum(f.stat().st_size for f in model_dir.rglob('*') if f.is_file())
-            size_gb = total_size / (1024**3)
+        # Shards are hashed once; unchanged files are skipped on later runs
+        for model_name in models:
+            entry = manifest.check(model_name, verify_hashes=True)
+            size_gb = entry.get('size', 0) / (1024**3)
             
-            # Check if complete (has model.safetensors or pytorch_model.bin)
-            has_weights = any(model_dir.rglob('model.safetensors')) or any(model_dir.rglob('pytorch_model.bin'))
-            status = "✅ Complete" if has_weights and size_gb > 1 else "⚠️ Incomplete"
+            status = "✅ Complete" if entry['status'] == 'complete' else "⚠️ Incomplete"
             
             print(f"  {status}")
             print(f"  Model: {model_name}")
-            print(f"  Size: {size_gb:.2f} GB")
-            print(f"  Path: {model_dir}")
+            print(f"  Size: {size_gb:.2f} GB ({len(entry.get('expected', []))} weight file(s))")
+            print(f"  Path: {manifest.model_dir(model_name)}")
+            for problem in entry['problems']:
+                print(f"  - {problem}")
             print()
+        
+        manifest.save()
 
 print("=" * 70)
 print("\nUsage:")
@@ -5,6 +5,11 @@ Run this once to download both models
 
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / 'hybrid_llm'))
+from model_manifest import ModelManifest
 
 print("=" * 70)
 print("Qwen Model Downloader")
@@ -46,6 +51,15 @@ for model_name, size, disk_size in models:
             ignore_patterns=["*.msgpack", "*.h5", "*.ot"]  # Skip unnecessary files
         )
         
+        # Hash every shard so interrupted or corrupt downloads are caught now
+        manifest = ModelManifest()
+        entry = manifest.check(model_name, verify_hashes=True)
+        manifest.save()
+        if entry['status'] != 'complete':
+            print(f"⚠️  {size} model is incomplete: {', '.join(entry['problems'])}")
+            print("Run this script again to resume the download")
+            continue
+        
         print(f"✅ {size} model downloaded successfully!")
         
     except Exception as e:
@@ -0,0 +1,256 @@
+"""
+Batch Runner - Non-interactive generation over a JSONL task file
+Schedules tasks by prompt length for throughput and resumes from its output
+
+Input lines:  {"id": "...", "task": "...", "use_rag": true, "max_new_tokens": 512, "temperature": 0.3}
+Output lines: {"id": "...", "task": "...", "response": "...", "prompt_tokens": N, "completion_tokens": N, ...}
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import as_completed
+from contextlib import nullcontext
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, List
+
+from main import build_coder, build_pool
+from network_monitor import offline_mode
+from profiler import RequestProfiler
+from telemetry import telemetry
+
+
+def load_tasks(path: str, defaults: Dict) -> List[Dict]:
+    """Read the task file; every task gets an id and its generation settings."""
+    tasks = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            task = dict(defaults, **json.loads(line))
+            task.setdefault('id', f"line-{line_no}")
+            task['id'] = str(task['id'])
+            tasks.append(task)
+    return tasks
+
+
+def load_completed(path: str) -> Dict[str, Dict]:
+    """
+    Records already written by earlier runs, by task id.
+
+    A run killed mid-write can leave a partial last line; the file is
+    rewritten without it so appended records stay valid JSONL.
+    """
+    if not Path(path).exists():
+        return {}
+    
+    completed, dropped = {}, 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                completed[record['id']] = record
+            except (ValueError, KeyError):
+                dropped += 1
+    
+    if dropped:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in completed.values():
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, path)
+        print(f"Dropped {dropped} partial record(s) from {path}")
+    return completed
+
+
+def schedule(tasks: List[Dict], batch_size: int, max_batch_tokens: int) -> List[List[Dict]]:
+    """
+    Group tasks into batches for throughput.
+
+    Tasks sharing generation settings are sorted by prompt length so each
+    batch pads little, longest first so memory problems show up early.
+    A batch is capped by size and by its padded token footprint.
+    """
+    def settings(task):
+        return (task['temperature'], task['max_new_tokens'])
+    
+    batches = []
+    for _, group in groupby(sorted(tasks, key=settings), key=settings):
+        group = sorted(group, key=lambda t: t['prompt_tokens'], reverse=True)
+        batch = []
+        for task in group:
+            # Sorted descending, so the first task sets the padded width
+            width = (batch[0] if batch else task)['prompt_tokens'] + task['max_new_tokens']
+            if batch and (len(batch) >= batch_size or (len(batch) + 1) * width > max_batch_tokens):
+                batches.append(batch)
+                batch = []
+            batch.append(task)
+        if batch:
+            batches.append(batch)
+    return batches
+
+
+class BatchRunner:
+    """Runs scheduled batches and appends each finished batch to the output."""
+    
+    def __init__(self, coder):
+        self.coder = coder
+        self.generated_tokens = 0
+        self.generate_seconds = 0.0
+        self.failed = 0
+    
+    def run_batch(self, batch: List[Dict], out):
+        start = time.perf_counter()
+        try:
+            results = self.coder.generate_batch(
+                [task['prompt'] for task in batch],
+                max_new_tokens=batch[0]['max_new_tokens'],
+                temperature=batch[0]['temperature']
+            )
+        except Exception as e:
+            if len(batch) > 1:
+                # Most often out of memory: retry as two smaller batches
+                print(f"⚠️  Batch of {len(batch)} failed ({e}); splitting")
+                half = len(batch) // 2
+                self.run_batch(batch[:half], out)
+                self.run_batch(batch[half:], out)
+                return
+            results = [{"error": str(e), "prompt_tokens": batch[0]['prompt_tokens'],
+                        "completion_tokens": 0}]
+            self.failed += 1
+        elapsed = time.perf_counter() - start
+        
+        for task, result in zip(batch, results):
+            record = {key: value for key, value in task.items() if key != 'prompt'}
+            record.update(result)
+            record['batch_size'] = len(batch)
+            record['batch_seconds'] = elapsed
+            out.write(json.dumps(record) + "\n")
+        # Checkpoint: a finished batch survives the process being killed
+        out.flush()
+        os.fsync(out.fileno())
+        
+        tokens = sum(r['completion_tokens'] for r in results)
+        self.generated_tokens += tokens
+        self.generate_seconds += elapsed
+        telemetry.incr('batch.tasks_done', len(batch))
+        print(f"  {len(batch)} task(s), {tokens} tokens in {elapsed:.1f}s "
+              f"({tokens / elapsed if elapsed else 0:.1f} tok/s)")
+    
+    def run_on_pool(self, pool, tasks: List[Dict], out):
+        """Single-sequence requests spread over replica workers, longest first."""
+        futures = {
+            pool.submit(task['prompt'], task['max_new_tokens'], task['temperature']): task
+            for task in sorted(tasks, key=lambda t: t['prompt_tokens'], reverse=True)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            task, result = futures[future], future.result()
+            record = {key: value for key, value in task.items() if key != 'prompt'}
+            record.update({key: value for key, value in result.items() if key != 'id'})
+            record['batch_size'] = 1
+            record['batch_seconds'] = result['seconds']
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            
+            self.generated_tokens += result['completion_tokens']
+            self.generate_seconds += result['seconds']
+            self.failed += 'error' in result
+            telemetry.incr('batch.tasks_done')
+            print(f"  [{done}/{len(tasks)}] {task['id']}: worker {result['worker']}, "
+                  f"{result['completion_tokens']} tokens in {result['seconds']:.1f}s")
+
+
+def overall_throughput(completed: Dict[str, Dict]) -> float:
+    """Tokens/sec over every record in the output, across resumed runs."""
+    tokens = sum(r.get('completion_tokens', 0) for r in completed.values())
+    # Each record carries its batch's wall time; share it across the batch
+    seconds = sum(r.get('batch_seconds', 0) / r.get('batch_size', 1) for r in completed.values())
+    return tokens / seconds if seconds else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tasks", help="Input JSONL, one task per line")
+    parser.add_argument("output", help="Output JSONL (also the resume checkpoint)")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-batch-tokens", type=int, default=32768,
+                        help="Cap on batch size x (prompt + new tokens)")
+    parser.add_argument("--max-new-tokens", type=int, default=None,
+                        help="Default for tasks that do not set it")
+    parser.add_argument("--no-rag", action="store_true", help="Default use_rag to false")
+    parser.add_argument("--profile", type=int, default=0, metavar="N",
+                        help="Profile the first N batches (traces go to profiling.output_dir)")
+    parser.add_argument("--replicas", type=int, default=None,
+                        help="Run on N forked workers sharing one model (CPU modes only)")
+    args = parser.parse_args()
+    
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    
+    defaults = {
+        'use_rag': not args.no_rag,
+        'max_new_tokens': args.max_new_tokens or config['generation']['max_tokens'],
+        'temperature': config['generation']['temperature'],
+    }
+    tasks = load_tasks(args.tasks, defaults)
+    completed = load_completed(args.output)
+    # Failed tasks are retried; their new record supersedes the error
+    pending = [task for task in tasks
+               if task['id'] not in completed or 'error' in completed[task['id']]]
+    print(f"{len(tasks)} tasks, {len(tasks) - len(pending)} already done, {len(pending)} to run")
+    if not pending:
+        print(f"Overall throughput: {overall_throughput(completed):.1f} tokens/sec")
+        return
+    
+    if args.replicas is not None:
+        config.setdefault('serving', {})['replicas'] = args.replicas
+    pool = build_pool(config)
+    coder, shards = build_coder(config, pool=pool)
+    
+    print("\nBuilding prompts...")
+    for task in pending:
+        task['prompt'] = coder._build_prompt(task['task'], task['use_rag'])
+        task['prompt_tokens'] = len(coder.tokenizer.encode(task['prompt']))
+    batches = [] if pool else schedule(pending, args.batch_size, args.max_batch_tokens)
+    if batches:
+        print(f"Scheduled {len(pending)} tasks into {len(batches)} batches\n")
+    
+    runner = BatchRunner(coder)
+    profiler = RequestProfiler(**dict(config.get('profiling', {}), requests=args.profile))
+    run_start = time.perf_counter()
+    offline = config['network']['offline_mode']
+    try:
+        with open(args.output, 'a', encoding='utf-8') as out:
+            if pool:
+                runner.run_on_pool(pool, pending, out)
+            for i, batch in enumerate(batches, 1):
+                print(f"[{i}/{len(batches)}] prompt ~{batch[0]['prompt_tokens']} tokens")
+                with offline_mode() if offline else nullcontext(), profiler.capture(f"batch{i}"):
+                    runner.run_batch(batch, out)
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume")
+    finally:
+        if shards:
+            shards.close()
+        if pool:
+            print("\n" + pool.summary())
+            pool.close()
+    
+    wall = time.perf_counter() - run_start
+    print("\n" + "=" * 70)
+    print(f"Generated {runner.generated_tokens} tokens in {wall:.1f}s "
+          f"({runner.generated_tokens / wall if wall else 0:.1f} tokens/sec wall, "
+          f"{runner.generated_tokens / runner.generate_seconds if runner.generate_seconds else 0:.1f} in generate)")
+    if runner.failed:
+        print(f"{runner.failed} task(s) failed; their records contain an 'error' field")
+    print(f"Overall throughput: {overall_throughput(load_completed(args.output)):.1f} tokens/sec")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark HTML text extraction against saved fixture pages
+Compares the old full-tree BeautifulSoup path with the streaming extractor
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+from web_search import extract_text_stream, HAS_LXML
+
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures" / "html"
+
+
+def legacy_extract(html: str, max_chars: int = 5000) -> str:
+    """Original fetch_page extraction: parse everything, then truncate."""
+    soup = BeautifulSoup(html, 'html.parser')
+    for script in soup(['script', 'style']):
+        script.decompose()
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    text = '\n'.join(chunk for chunk in chunks if chunk)
+    return text[:max_chars]
+
+
+def chunked(html: str, chunk_size: int = 16384):
+    """Simulate a streamed response body."""
+    for i in range(0, len(html), chunk_size):
+        yield html[i:i + chunk_size]
+
+
+def bench(name: str, func, html: str, runs: int) -> float:
+    """Return throughput in MB/s of the source page."""
+    start = time.perf_counter()
+    for _ in range(runs):
+        func(html)
+    elapsed = time.perf_counter() - start
+    mb = len(html.encode('utf-8')) * runs / (1024 ** 2)
+    print(f"  {name:<20} {elapsed / runs * 1000:8.2f} ms/page  {mb / elapsed:8.1f} MB/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fixtures", default=str(FIXTURE_DIR))
+    parser.add_argument("--repeat", type=int, default=50,
+                        help="Concatenate each fixture N times to simulate large pages")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-chars", type=int, default=5000)
+    args = parser.parse_args()
+
+    fixtures = sorted(Path(args.fixtures).glob("*.html"))
+    if not fixtures:
+        print(f"No fixtures found in {args.fixtures}")
+        return
+
+    print("=" * 70)
+    print("HTML Extraction Benchmark")
+    print(f"lxml available: {HAS_LXML}")
+    print("=" * 70)
+
+    for path in fixtures:
+        html = path.read_text(encoding='utf-8') * args.repeat
+        size_mb = len(html.encode('utf-8')) / (1024 ** 2)
+        print(f"\n{path.name} x{args.repeat} ({size_mb:.1f} MB)")
+
+        candidates = [
+            ("legacy bs4", lambda h: legacy_extract(h, args.max_chars)),
+            ("stream stdlib", lambda h: extract_text_stream(
+                chunked(h), args.max_chars, use_lxml=False)),
+        ]
+        if HAS_LXML:
+            candidates.append(("stream lxml", lambda h: extract_text_stream(
+                chunked(h), args.max_chars, use_lxml=True)))
+
+        for name, func in candidates:
+            bench(name, func, html, args.runs)
+
+
+if __name__ == "__main__":
+    main()
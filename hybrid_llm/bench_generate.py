@@ -0,0 +1,299 @@
+"""
+Generation Benchmark - Reproducible inference speed across configured models
+Reports load time, time-to-first-token, prefill/decode tokens/sec and peak RSS
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from model_selector import QUANT_MODES
+from telemetry import Telemetry, GenerationTimer, peak_rss_mb
+
+
+SEED = 1234
+
+# Fixed code block used to build the long prompt
+_LONG_SNIPPET = '''
+def merge_intervals(intervals):
+    """Merge overlapping [start, end] intervals."""
+    if not intervals:
+        return []
+    intervals = sorted(intervals, key=lambda x: x[0])
+    merged = [list(intervals[0])]
+    for start, end in intervals[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+'''
+
+PROMPT_SUITE = [
+    {"name": "short_in/short_out", "rag": False, "max_new_tokens": 64,
+     "prompt": "Write a Python function that reverses a string."},
+    {"name": "short_in/long_out", "rag": False, "max_new_tokens": 512,
+     "prompt": "Write a Python class implementing an LRU cache with tests."},
+    {"name": "long_in/short_out", "rag": False, "max_new_tokens": 64,
+     "prompt": "Refactor this module for readability:\n" + _LONG_SNIPPET * 12},
+    {"name": "long_in/long_out", "rag": False, "max_new_tokens": 512,
+     "prompt": "Add type hints and docstrings to this module:\n" + _LONG_SNIPPET * 12},
+    {"name": "rag/short_out", "rag": True, "max_new_tokens": 64,
+     "prompt": "Create a web search helper that caches fetched pages"},
+    {"name": "rag/long_out", "rag": True, "max_new_tokens": 512,
+     "prompt": "Create a web search helper that caches fetched pages"},
+]
+
+class ByteTokenizer:
+    """Stand-in tokenizer for tiny random models (UTF-8 bytes as ids)."""
+
+    vocab_size = 260
+    eos_token_id = 256
+
+    def encode(self, text: str) -> List[int]:
+        return list(text.encode('utf-8'))
+
+
+def build_prompts(codebase_path: str) -> List[Dict]:
+    """Expand RAG cases with context retrieved from a fixed codebase."""
+    from codebase_rag import CodebaseRAG
+
+    rag = CodebaseRAG(codebase_path, docs_index_path=None)
+    prompts = []
+    for case in PROMPT_SUITE:
+        prompt = case["prompt"]
+        if case["rag"]:
+            prompt += "\n\n## Reference Code Patterns:\n"
+            for result in rag.search(case["prompt"], top_k=3, include_docs=False):
+                prompt += f"```{result['language']}\n{result['content']}\n```\n"
+        prompts.append(dict(case, prompt=prompt))
+    return prompts
+
+
+def load_model(model_name: str, quant: str, tiny: bool, snapshot_dir: str = None):
+    """Return (model, tokenizer, load_seconds)."""
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    start = time.perf_counter()
+
+    if tiny:
+        from transformers import Qwen2Config
+        torch.manual_seed(SEED)
+        config = Qwen2Config(
+            vocab_size=ByteTokenizer.vocab_size,
+            hidden_size=128,
+            intermediate_size=256,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+            max_position_embeddings=4096,
+            eos_token_id=ByteTokenizer.eos_token_id,
+        )
+        model = AutoModelForCausalLM.from_config(config)
+        tokenizer = ByteTokenizer()
+    else:
+        from rag_coder import load_model as load_quantized
+        tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+        model = load_quantized(model_name, quant, snapshot_dir)
+
+    model.eval()
+    return model, tokenizer, time.perf_counter() - start
+
+
+def encode_prompt(tokenizer, prompt: str):
+    import torch
+
+    if isinstance(tokenizer, ByteTokenizer):
+        return torch.tensor([tokenizer.encode(prompt)])
+
+    text = tokenizer.apply_chat_template(
+        [{"role": "user", "content": prompt}],
+        tokenize=False,
+        add_generation_prompt=True
+    )
+    return tokenizer(text, return_tensors="pt").input_ids
+
+
+def run_case(model, tokenizer, case: Dict, prompt_lookup: int = 0) -> Dict:
+    """
+    Greedy, fixed-length generation so every run does identical work.
+
+    prompt_lookup > 0 drafts that many tokens per step from prompt n-grams.
+    """
+    import torch
+    from transformers import StoppingCriteriaList
+
+    input_ids = encode_prompt(tokenizer, case["prompt"]).to(model.device)
+    stats = Telemetry()
+    timer = GenerationTimer(stats, input_ids.shape[1], input_width=input_ids.shape[1])
+    lookup_kwargs = {"prompt_lookup_num_tokens": prompt_lookup} if prompt_lookup else {}
+
+    torch.manual_seed(SEED)
+    with torch.no_grad():
+        model.generate(
+            input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=case["max_new_tokens"],
+            min_new_tokens=case["max_new_tokens"],
+            do_sample=False,
+            pad_token_id=tokenizer.eos_token_id,
+            stopping_criteria=StoppingCriteriaList([timer]),
+            **lookup_kwargs
+        )
+    timer.finish()
+
+    def first(name):
+        values = stats.samples.get(name)
+        return values[0] if values else None
+
+    return {
+        "prompt_tokens": input_ids.shape[1],
+        "output_tokens": timer.new_tokens,
+        "tokens_per_step": timer.new_tokens / timer.steps if timer.steps else None,
+        "ttft_s": first("generate.prefill_s"),
+        "prefill_tps": first("generate.prefill_tps"),
+        "decode_tps": first("generate.decode_tps"),
+        "total_s": first("generate.total_s"),
+    }
+
+
+def bench_model(model_name: str, quant: str, tiny: bool, prompts: List[Dict],
+                repeats: int, threads: int, snapshot_dir: str = None,
+                prompt_lookup: int = 0) -> Dict:
+    """Benchmark one model/quantization pair (runs in its own process)."""
+    import torch
+
+    torch.set_num_threads(threads)
+    result = {"model": model_name, "quant": "random-init" if tiny else quant,
+              "prompt_lookup": prompt_lookup}
+    try:
+        model, tokenizer, load_s = load_model(model_name, quant, tiny, snapshot_dir)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    result["load_s"] = load_s
+    result["cases"] = {}
+    for case in prompts:
+        run_case(model, tokenizer, dict(case, max_new_tokens=4), prompt_lookup)  # warmup
+        runs = [run_case(model, tokenizer, case, prompt_lookup) for _ in range(repeats)]
+        summary = {"prompt_tokens": runs[0]["prompt_tokens"],
+                   "output_tokens": runs[0]["output_tokens"]}
+        for key in ("ttft_s", "prefill_tps", "decode_tps", "total_s", "tokens_per_step"):
+            values = [r[key] for r in runs if r[key] is not None]
+            summary[key] = statistics.median(values) if values else None
+        result["cases"][case["name"]] = summary
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def environment(threads: int) -> Dict:
+    import torch
+    import transformers
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "threads": threads,
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "seed": SEED,
+    }
+
+
+def configured_models(config_path: str) -> List[str]:
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    models = [config['model']['name']]
+    models += list(config['model'].get('alternatives', {}).values())
+    return list(dict.fromkeys(models))
+
+
+def print_report(results: List[Dict]):
+    print("\n" + "=" * 100)
+    print(f"{'model':<36} {'quant':<12} {'case':<20} {'ttft':>8} "
+          f"{'prefill':>10} {'decode':>9} {'tokens':>7}")
+    print(f"{'':<36} {'':<12} {'':<20} {'(s)':>8} {'(tok/s)':>10} {'(tok/s)':>9} {'/step':>7}")
+    print("=" * 100)
+    for result in results:
+        name = result["model"].split('/')[-1]
+        if "error" in result:
+            print(f"{name:<36} {result['quant']:<12} ERROR: {result['error'][:40]}")
+            continue
+        for case, s in result["cases"].items():
+            print(f"{name:<36} {result['quant']:<12} {case:<20} "
+                  f"{_fmt(s['ttft_s'], 3):>8} {_fmt(s['prefill_tps'], 1):>10} "
+                  f"{_fmt(s['decode_tps'], 1):>9} {_fmt(s.get('tokens_per_step'), 2):>7}")
+        print(f"{'':<36} load {result['load_s']:.1f}s, "
+              f"peak RSS {_fmt(result['peak_rss_mb'], 0)} MB")
+    print("=" * 100)
+
+
+def _fmt(value, digits):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--models", nargs="*",
+                        help="Model names (default: all models in config.json)")
+    parser.add_argument("--quant", nargs="*", default=["4bit"], choices=QUANT_MODES)
+    parser.add_argument("--tiny", action="store_true",
+                        help="Use tiny randomly initialized Qwen2 models (offline)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--codebase", default=".")
+    parser.add_argument("--snapshot-dir", default=None,
+                        help="Load/save quantized snapshots here (measures snapshot load time)")
+    parser.add_argument("--prompt-lookup", type=int, default=0, metavar="N",
+                        help="Prompt lookup decoding with N draft tokens per step")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    if args.tiny:
+        # All configured models share the Qwen2 architecture
+        models, quants = ["tiny-qwen2"], ["none"]
+    else:
+        models = args.models or configured_models(args.config)
+        quants = args.quant
+    prompts = build_prompts(args.codebase)
+
+    print("=" * 70)
+    print("Generation Benchmark")
+    print(f"Models: {', '.join(models)}")
+    print(f"Quantization: {', '.join(quants)}  Threads: {args.threads}")
+    print("=" * 70)
+
+    # Fresh process per configuration so load time and peak RSS are isolated
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for model_name in models:
+        for quant in quants:
+            print(f"\nBenchmarking {model_name} ({quant})...")
+            with ctx.Pool(1) as pool:
+                results.append(pool.apply(
+                    bench_model,
+                    (model_name, quant, args.tiny, prompts, args.repeats, args.threads,
+                     args.snapshot_dir, args.prompt_lookup)
+                ))
+
+    print_report(results)
+
+    report = {"environment": environment(args.threads), "results": results}
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
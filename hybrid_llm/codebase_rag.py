@@ -0,0 +1,418 @@
+"""
+Codebase RAG - Keyword, symbol and cached-docs retrieval over local code
+Kept free of model imports so index workers start quickly
+"""
+
+import os
+import re
+import json
+import time
+from pathlib import Path
+from typing import List, Dict, Optional
+from telemetry import telemetry
+from symbol_index import SymbolIndex
+from near_dupes import LSHIndex, minhash, diversify
+from trigram_index import TrigramIndex
+
+
+CODE_EXTENSIONS = {'.py', '.js', '.ts', '.java', '.cpp', '.c', '.go', '.rs'}
+
+
+def iter_source_files(root: Path, extensions=CODE_EXTENSIONS):
+    """Yield (path, language) for source files under root, skipping vendored trees."""
+    for ext in extensions:
+        for file_path in Path(root).rglob(f'*{ext}'):
+            if 'venv' in str(file_path) or 'node_modules' in str(file_path):
+                continue
+            yield file_path, ext[1:]
+
+
+def normalize_scores(results: List[Dict]) -> List[Dict]:
+    """Scale scores in place so the best result of a partition scores 1."""
+    best = max((r['score'] for r in results), default=1)
+    for result in results:
+        result['score'] = result['score'] / best
+    return results
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
+    """Split text into overlapping chunks, preferring line boundaries."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            newline = text.rfind('\n', start + chunk_size // 2, end)
+            if newline != -1:
+                end = newline
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class CodebaseRAG:
+    """Simple RAG system for local code reference."""
+    
+    def __init__(
+        self,
+        codebase_path: str = ".",
+        docs_index_path: str = ".rag_cache/docs_index.json",
+        index_path: str = None,
+        verbose: bool = True
+    ):
+        self.codebase_path = Path(codebase_path)
+        self.code_index = {}
+        # Persisted code index; unchanged files are not re-read on the next start
+        self.index_path = Path(index_path) if index_path else None
+        self.verbose = verbose
+        # Identifier -> definition lookup for exact symbol queries
+        self.symbols = SymbolIndex()
+        # Web docs fetched while online, persisted for offline reuse
+        self.docs_index_path = Path(docs_index_path) if docs_index_path else None
+        self.docs_index = {}
+        self._index_codebase()
+        self._load_docs()
+    
+    def _index_codebase(self):
+        """Index all code files for quick retrieval."""
+        with telemetry.timer('rag.index'):
+            reread = self._crawl(CODE_EXTENSIONS)
+            reread += self._collapse_duplicates()
+            if self.index_path and reread:
+                self._save_code_index()
+        with telemetry.timer('rag.trigrams'):
+            self.trigrams = self._load_trigrams()
+        telemetry.gauge('rag.trigrams', len(self.trigrams))
+        duplicates = sum('duplicate_of' in data for data in self.code_index.values())
+        telemetry.gauge('rag.files_indexed', len(self.code_index))
+        telemetry.gauge('rag.duplicates_collapsed', duplicates)
+        
+        with telemetry.timer('rag.symbols'):
+            for path, data in self.code_index.items():
+                if 'content' in data:
+                    self.symbols.add_file(path, data['content'], data['language'])
+        telemetry.gauge('rag.symbols_indexed', len(self.symbols))
+        
+        if self.verbose:
+            print(f"Indexed {len(self.code_index)} code files ({len(self.symbols)} symbols, "
+                  f"{duplicates} near-duplicates collapsed)")
+    
+    def _crawl(self, extensions) -> int:
+        """
+        Read every matching source file into the code index.
+        
+        Files whose mtime and size match the persisted index are taken from
+        it instead of being read again. Returns the number of files read
+        (or dropped), i.e. whether the persisted index is stale.
+        """
+        previous = self._load_code_index()
+        changed = 0
+        for file_path, language in iter_source_files(self.codebase_path, extensions):
+            try:
+                stat = file_path.stat()
+                cached = previous.pop(str(file_path), None)
+                if cached and cached.get('mtime') == stat.st_mtime \
+                        and cached.get('bytes') == stat.st_size:
+                    self.code_index[str(file_path)] = cached
+                    continue
+                
+                self.code_index[str(file_path)] = self._read_file(file_path, language, stat)
+                changed += 1
+            except:
+                pass
+        return changed + len(previous)
+    
+    def _read_file(self, file_path: Path, language: str, stat) -> Dict:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return {
+            'content': content,
+            'language': language,
+            'size': len(content),
+            'bytes': stat.st_size,
+            'mtime': stat.st_mtime,
+            'minhash': minhash(content)
+        }
+    
+    def _collapse_duplicates(self) -> int:
+        """
+        Fold near-identical files into one canonical entry.
+        
+        The shallowest, shortest path of each group is kept with a 'copies'
+        list; the others keep only their metadata and signature, with
+        'duplicate_of' pointing at it. A former copy whose original changed
+        is read again. Returns the number of entries that changed role.
+        """
+        lsh = LSHIndex()
+        changed = 0
+        order = sorted(self.code_index, key=lambda p: (p.count(os.sep), len(p), p))
+        for path in order:
+            data = self.code_index[path]
+            data.pop('copies', None)
+            if 'content' in data and ('minhash' not in data or not data['content'].strip()):
+                # Indexed before signatures existed, or an empty file whose
+                # stored signature predates empty files having none
+                data['minhash'] = minhash(data['content'])
+            
+            canonical = lsh.match(data['minhash']) if data['minhash'] else None
+            if canonical:
+                changed += data.get('duplicate_of') != canonical
+                self.code_index[canonical].setdefault('copies', []).append(path)
+                data['duplicate_of'] = canonical
+                data.pop('content', None)
+                continue
+            
+            if 'content' not in data:
+                try:
+                    file_path = Path(path)
+                    data = self._read_file(file_path, data['language'], file_path.stat())
+                    self.code_index[path] = data
+                except (OSError, UnicodeDecodeError):
+                    del self.code_index[path]
+                    changed += 1
+                    continue
+            changed += 'duplicate_of' in data
+            data.pop('duplicate_of', None)
+            if data['minhash']:
+                lsh.add(path, data['minhash'])
+        return changed
+    
+    def _load_code_index(self) -> Dict:
+        if not self.index_path or not self.index_path.exists():
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_code_index(self):
+        """Write the code index atomically."""
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.code_index, f)
+        os.replace(tmp_path, self.index_path)
+    
+    def _load_trigrams(self) -> TrigramIndex:
+        """Trigram index saved next to the code index, updated for the files that changed."""
+        trigram_path = self.index_path.with_suffix('.trigrams.json') if self.index_path else None
+        index = TrigramIndex.load(trigram_path) if trigram_path else None
+        if index is None:
+            index = TrigramIndex()
+        if index.update(self.code_index, self._file_text) and trigram_path:
+            index.save(trigram_path)
+        return index
+    
+    def _file_text(self, path: str) -> Optional[str]:
+        """Indexed content, or the file on disk for a collapsed copy (None if unreadable)."""
+        data = self.code_index[path]
+        if 'content' in data:
+            return data['content']
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+    
+    def _load_docs(self):
+        """Load the persistent docs partition, if any."""
+        if not self.docs_index_path or not self.docs_index_path.exists():
+            return
+        
+        try:
+            with open(self.docs_index_path, 'r', encoding='utf-8') as f:
+                self.docs_index = json.load(f)
+            print(f"Loaded {len(self.docs_index)} cached doc chunks")
+        except (OSError, ValueError) as e:
+            print(f"Could not load docs index: {e}")
+            self.docs_index = {}
+    
+    def _save_docs(self):
+        """Write the docs partition atomically."""
+        if not self.docs_index_path:
+            return
+        
+        self.docs_index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.docs_index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.docs_index, f)
+        os.replace(tmp_path, self.docs_index_path)
+    
+    def add_document(self, url: str, text: str, fetched_at: float = None) -> int:
+        """
+        Chunk a fetched web page into the docs partition.
+        
+        Re-fetching a URL replaces its previous chunks. Returns the number
+        of chunks stored.
+        """
+        if not text:
+            return 0
+        
+        fetched_at = fetched_at or time.time()
+        
+        for key in [k for k, v in self.docs_index.items() if v['source_url'] == url]:
+            del self.docs_index[key]
+        
+        chunks = chunk_text(text)
+        for i, chunk in enumerate(chunks):
+            self.docs_index[f"{url}#{i}"] = {
+                'content': chunk,
+                'language': 'text',
+                'size': len(chunk),
+                'source_url': url,
+                'fetched_at': fetched_at
+            }
+        
+        self._save_docs()
+        return len(chunks)
+    
+    def search(self, query: str, top_k: int = 3, include_docs: bool = True) -> List[Dict]:
+        """Simple keyword-based search (can be upgraded to embeddings)."""
+        with telemetry.timer('rag.search'):
+            # Over-fetch so near-identical snippets can be dropped
+            candidates = self._search(query, top_k * 2, include_docs)
+            return diversify(candidates, top_k)
+    
+    def _search(self, query: str, top_k: int, include_docs: bool) -> List[Dict]:
+        # Exact identifiers resolve straight to their definitions
+        results = self.search_symbols(query, top_k)
+        if len(results) >= top_k:
+            return results[:top_k]
+        covered = {r['file'] for r in results}
+        
+        query_lower = query.lower()
+        words = query_lower.split()
+        keyword_results = []
+        
+        for path, data in self.code_index.items():
+            if path in covered or 'duplicate_of' in data:
+                continue
+            content_lower = data['content'].lower()
+            
+            # Count keyword matches
+            score = sum(content_lower.count(word) for word in words)
+            
+            if score > 0:
+                keyword_results.append({
+                    'path': path,
+                    'score': score,
+                    'content': data['content'][:1000],  # First 1000 chars
+                    'language': data['language'],
+                    'copies': list(data.get('copies', []))
+                })
+        
+        # Whole files collect far more raw matches than short doc chunks, so
+        # each partition is scaled to its own best hit before they compete
+        normalize_scores(keyword_results)
+        if include_docs:
+            keyword_results.extend(normalize_scores(self.search_docs(query, top_k)))
+        
+        # Sort by score and fill the remaining slots
+        keyword_results.sort(key=lambda x: x['score'], reverse=True)
+        return results + keyword_results[:top_k - len(results)]
+    
+    def grep(self, pattern: str, literal: bool = False, ignore_case: bool = False,
+             max_results: int = 20, context_lines: int = 2) -> List[Dict]:
+        """
+        Exact substring (literal=True) or regex matches, one result per line.
+        
+        The trigram index narrows the files to scan; each result carries the
+        matching line and a few lines around it as 'content'. Collapsed copies
+        are read from disk and only report lines their canonical file does
+        not already match. Raises re.error for an invalid regex.
+        """
+        regex = re.escape(pattern) if literal else pattern
+        compiled = re.compile(regex, re.IGNORECASE if ignore_case else 0)
+        with telemetry.timer('rag.grep'):
+            candidates = self.trigrams.candidates(regex)
+            telemetry.observe('rag.grep_candidates', len(candidates))
+            results = []
+            for path in candidates:
+                results.extend(self._grep_file(path, compiled, context_lines,
+                                               max_results - len(results)))
+                if len(results) >= max_results:
+                    break
+        return results
+    
+    def _grep_file(self, path: str, compiled, context_lines: int, limit: int) -> List[Dict]:
+        data = self.code_index[path]
+        content = self._file_text(path)
+        if content is None or limit <= 0:
+            return []
+        canonical = data.get('duplicate_of')
+        seen = set()
+        if canonical:
+            # Lines the canonical file matches are already reported with it
+            original = self._file_text(canonical) or ''
+            seen = {line.strip() for line in original.split('\n') if compiled.search(line)}
+        lines = None
+        results = []
+        line_no, position, last_line = 0, 0, -1
+        for match in compiled.finditer(content):
+            line_no += content.count('\n', position, match.start())
+            position = match.start()
+            if line_no == last_line:
+                continue
+            last_line = line_no
+            
+            lines = lines or content.split('\n')  # same breaks as the '\n' count above
+            text = lines[line_no].strip() if line_no < len(lines) else ''
+            if text in seen:
+                continue
+            start = max(0, line_no - context_lines)
+            results.append({
+                'path': f"{path}:{line_no + 1}",
+                'file': path,
+                'line': line_no + 1,
+                'text': text,
+                'score': 1.0,
+                'content': "\n".join(lines[start:line_no + context_lines + 1]),
+                'language': data['language'],
+                'copies': list(data.get('copies', []))
+            })
+            if len(results) >= limit:
+                break
+        return results
+    
+    def search_symbols(self, query: str, top_k: int = 3) -> List[Dict]:
+        """Definitions of identifiers named in the query, then what they use."""
+        results = []
+        for definition in self.symbols.resolve(query)[:top_k]:
+            data = self.code_index[definition['path']]
+            results.append({
+                'path': f"{definition['path']}:{definition['start']}",
+                'file': definition['path'],
+                'score': float('inf'),
+                'content': definition['content'][:2000],
+                'language': data['language'],
+                'symbol': definition['name'],
+                'relation': definition['relation']
+            })
+        return results
+    
+    def search_docs(self, query: str, top_k: int = 3) -> List[Dict]:
+        """Keyword search over the cached web docs partition only."""
+        results = []
+        words = query.lower().split()
+        
+        for key, data in self.docs_index.items():
+            content_lower = data['content'].lower()
+            score = sum(content_lower.count(word) for word in words)
+            
+            if score > 0:
+                results.append({
+                    'path': key,
+                    'score': score,
+                    'content': data['content'],
+                    'language': data['language'],
+                    'source_url': data['source_url'],
+                    'fetched_at': data['fetched_at']
+                })
+        
+        results.sort(key=lambda x: x['score'], reverse=True)
+        return results[:top_k]
@@ -0,0 +1,280 @@
+"""
+Context Compressor - Shrink retrieved code before it is injected into prompts
+Strips comments/docstrings, collapses whitespace, dedupes imports, elides bodies
+"""
+
+import ast
+import io
+import re
+import tokenize
+from typing import Callable, Dict, List, Optional, Set
+
+
+DEFAULT_SETTINGS = {
+    "strip_comments": True,
+    "docstrings": "first_line",   # "keep", "first_line" or "strip"
+    "collapse_whitespace": True,
+    "dedupe_imports": True,
+    "elide_bodies": False,        # replace bodies unrelated to the query with "..."
+}
+
+_IMPORT_PATTERNS = {
+    "py": re.compile(r"^\s*(import|from)\s+\S+"),
+    "js": re.compile(r"^\s*(import\s.+|(const|let|var)\s+\w+\s*=\s*require\(.+)"),
+    "ts": re.compile(r"^\s*(import\s.+|(const|let|var)\s+\w+\s*=\s*require\(.+)"),
+    "java": re.compile(r"^\s*import\s+[\w.*]+\s*;"),
+    "go": re.compile(r'^\s*import\s+("[^"]+"|\w+\s+"[^"]+")'),
+    "rs": re.compile(r"^\s*(pub\s+)?use\s+[\w:{}, *]+;"),
+    "cpp": re.compile(r"^\s*#\s*include\s*[<\"]"),
+    "c": re.compile(r"^\s*#\s*include\s*[<\"]"),
+}
+
+# Languages whose single quotes delimit strings (not Rust lifetimes)
+_SINGLE_QUOTE_STRINGS = {"js", "ts", "java", "cpp", "c", "go"}
+
+_C_SIGNATURE = re.compile(r"^\s*[\w<>\[\]*&:,\s().]+\)\s*(->\s*[\w<>\[\]&:, ]+)?\s*(throws [\w., ]+)?\s*\{\s*$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for code)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+# English filler that appears in nearly every body; matching it would keep everything
+_STOPWORDS = {
+    "the", "and", "for", "that", "with", "this", "from", "into", "are", "was", "but",
+    "not", "all", "any", "can", "has", "have", "how", "its", "our", "out", "use",
+    "using", "what", "when", "which", "will", "you", "your", "write", "make", "add",
+    "code", "function", "please", "should", "does", "new", "get", "set",
+}
+
+
+def _query_words(query: str) -> Set[str]:
+    return {w for w in re.findall(r"[a-zA-Z_]\w+", query.lower())
+            if len(w) > 2 and w not in _STOPWORDS}
+
+
+def _relevant(text: str, words: Set[str]) -> bool:
+    text = text.lower()
+    return any(word in text for word in words)
+
+
+def _collapse_whitespace(code: str) -> str:
+    return "\n".join(line.rstrip() for line in code.splitlines() if line.strip())
+
+
+def _python_edits(source: str, settings: Dict, words: Set[str]) -> str:
+    """Docstring and body edits driven by the AST (skipped if it won't parse)."""
+    lines = source.splitlines()
+    tail = []
+    tree = None
+    # Retrieved snippets are often cut mid-statement: parse the longest prefix that works
+    for _ in range(min(len(lines), 200)):
+        try:
+            tree = ast.parse("\n".join(lines))
+            break
+        except SyntaxError:
+            tail.insert(0, lines.pop())
+    if tree is None:
+        return source
+    
+    edits = []  # (first_line, last_line, replacement_lines), 1-based inclusive
+    
+    def docstring_node(node):
+        body = getattr(node, "body", None)
+        if body and isinstance(body[0], ast.Expr) and isinstance(
+                getattr(body[0], "value", None), ast.Constant) and isinstance(body[0].value.value, str):
+            return body[0]
+        return None
+    
+    def shares_line(stmt, following=None):
+        """True if stmt starts after other code on its line or following ends up on its last line."""
+        if lines[stmt.lineno - 1].encode()[:stmt.col_offset].strip():
+            return True
+        return following is not None and following.lineno == stmt.end_lineno
+    
+    def visit(node):
+        for child in ast.iter_child_nodes(node):
+            is_def = isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+            if not is_def:
+                continue
+            
+            # One-line bodies (def f(): return 1) share the signature's line
+            # and are left alone: deleting their lines would drop the def
+            if (settings["elide_bodies"] and not isinstance(child, ast.ClassDef)
+                    and not shares_line(child.body[0])):
+                segment = "\n".join(lines[child.lineno - 1:child.end_lineno])
+                if not _relevant(segment, words):
+                    first = child.body[0]
+                    indent = " " * first.col_offset
+                    edits.append((first.lineno, child.end_lineno, [indent + "..."]))
+                    continue
+            
+            doc = docstring_node(child)
+            following = child.body[1] if len(child.body) > 1 else None
+            if (doc is not None and settings["docstrings"] != "keep"
+                    and not shares_line(doc, following)):
+                indent = " " * doc.col_offset
+                summary = doc.value.value.strip().splitlines()
+                if settings["docstrings"] == "first_line" and summary:
+                    first_line = summary[0].strip()
+                    if '"""' in first_line or first_line.endswith('"') or "\\" in first_line:
+                        replacement = [indent + repr(first_line)]
+                    else:
+                        replacement = [f'{indent}"""{first_line}"""']
+                elif len(child.body) == 1:
+                    replacement = [indent + "..."]
+                else:
+                    replacement = []
+                edits.append((doc.lineno, doc.end_lineno, replacement))
+            
+            visit(child)
+    
+    module_doc = docstring_node(tree)
+    if module_doc is not None and settings["docstrings"] != "keep":
+        edits.append((module_doc.lineno, module_doc.end_lineno, []))
+    visit(tree)
+    
+    for first, last, replacement in sorted(edits, reverse=True):
+        lines[first - 1:last] = replacement
+    return "\n".join(lines + tail)
+
+
+def _strip_python_comments(source: str) -> str:
+    cuts = {}
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(source).readline):
+            if tok.type == tokenize.COMMENT:
+                cuts[tok.start[0]] = tok.start[1]
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        pass  # truncated snippet: keep the cuts found so far
+    
+    lines = source.splitlines()
+    for row, col in cuts.items():
+        lines[row - 1] = lines[row - 1][:col].rstrip()
+    return "\n".join(lines)
+
+
+def compress_python(source: str, settings: Dict, words: Set[str]) -> str:
+    source = _python_edits(source, settings, words)
+    if settings["strip_comments"]:
+        source = _strip_python_comments(source)
+    return source
+
+
+def _strip_c_comments(source: str, language: str) -> str:
+    """Remove // and /* */ comments, leaving string literals intact."""
+    out = []
+    i, n = 0, len(source)
+    quotes = {'"', "`"} | ({"'"} if language in _SINGLE_QUOTE_STRINGS else set())
+    while i < n:
+        ch = source[i]
+        if ch in quotes:
+            j = i + 1
+            while j < n and source[j] != ch:
+                j += 2 if source[j] == "\\" else 1
+            out.append(source[i:j + 1])
+            i = j + 1
+        elif source.startswith("//", i):
+            j = source.find("\n", i)
+            i = n if j == -1 else j
+        elif source.startswith("/*", i):
+            j = source.find("*/", i + 2)
+            i = n if j == -1 else j + 2
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def _elide_c_bodies(source: str, words: Set[str]) -> str:
+    """Replace bodies of irrelevant brace-delimited functions with '{ ... }'."""
+    lines = source.splitlines()
+    out = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if _C_SIGNATURE.match(line) and not re.match(r"^\s*(if|for|while|switch|catch)\b", line):
+            depth, j = 0, i
+            while j < len(lines):
+                depth += lines[j].count("{") - lines[j].count("}")
+                if depth <= 0 and j > i:
+                    break
+                j += 1
+            body = "\n".join(lines[i:j + 1])
+            if j < len(lines) and not _relevant(body, words):
+                out.append(line.rstrip()[:-1].rstrip() + " { ... }")
+                i = j + 1
+                continue
+        out.append(line)
+        i += 1
+    return "\n".join(out)
+
+
+def compress_c_like(source: str, language: str, settings: Dict, words: Set[str]) -> str:
+    if settings["strip_comments"]:
+        source = _strip_c_comments(source, language)
+    if settings["elide_bodies"]:
+        source = _elide_c_bodies(source, words)
+    return source
+
+
+class ContextCompressor:
+    """Compress a set of retrieved snippets for one prompt."""
+    
+    def __init__(self, config: Optional[Dict] = None,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        config = config or {}
+        self.enabled = config.get("enabled", True)
+        self.defaults = dict(DEFAULT_SETTINGS, **config.get("default", {}))
+        self.languages = config.get("languages", {})
+        self.count_tokens = count_tokens
+    
+    def settings_for(self, language: str) -> Dict:
+        return dict(self.defaults, **self.languages.get(language, {}))
+    
+    def compress(self, code: str, language: str, query: str = "",
+                 seen_imports: Optional[Set[str]] = None) -> str:
+        """Compress one snippet; seen_imports is shared across a prompt's snippets."""
+        settings = self.settings_for(language)
+        words = _query_words(query)
+        
+        if language == "py":
+            code = compress_python(code, settings, words)
+        elif language in _IMPORT_PATTERNS:
+            code = compress_c_like(code, language, settings, words)
+        
+        if settings["dedupe_imports"] and seen_imports is not None and language in _IMPORT_PATTERNS:
+            pattern = _IMPORT_PATTERNS[language]
+            kept = []
+            for line in code.splitlines():
+                if pattern.match(line):
+                    key = f"{language}:{line.strip()}"
+                    if key in seen_imports:
+                        continue
+                    seen_imports.add(key)
+                kept.append(line)
+            code = "\n".join(kept)
+        
+        if settings["collapse_whitespace"]:
+            code = _collapse_whitespace(code)
+        return code
+    
+    def compress_results(self, results: List[Dict], query: str) -> Dict:
+        """Compress search results in place and report the token savings."""
+        raw_tokens = self.count_tokens("".join(r["content"] for r in results))
+        if not self.enabled:
+            return {"raw_tokens": raw_tokens, "compressed_tokens": raw_tokens, "saved_tokens": 0}
+        
+        seen_imports = set()
+        for result in results:
+            result["content"] = self.compress(
+                result["content"], result["language"], query, seen_imports
+            )
+        
+        compressed_tokens = self.count_tokens("".join(r["content"] for r in results))
+        return {
+            "raw_tokens": raw_tokens,
+            "compressed_tokens": compressed_tokens,
+            "saved_tokens": raw_tokens - compressed_tokens,
+        }
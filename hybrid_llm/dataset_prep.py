@@ -0,0 +1,266 @@
+"""
+Dataset Prep - Stream a code corpus into packed, memory-mapped training data
+Crawl -> chunk -> dedupe -> chat template -> parallel tokenize -> pack to disk
+Memory use is bounded by the window size, not by the corpus
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import re
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from codebase_rag import chunk_text, iter_source_files
+
+
+TOKEN_DTYPE = np.uint32  # Qwen's vocabulary does not fit in uint16
+
+# Tokenizer loaded once per worker process
+_tokenizer = None
+
+
+def iter_code_samples(roots: List[str], chunk_chars: int = 4000) -> Iterator[Dict]:
+    """One sample per chunk of each source file, read one file at a time."""
+    for root in roots:
+        root = Path(root)
+        for file_path, language in iter_source_files(root):
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            
+            relative = file_path.relative_to(root).as_posix()
+            for chunk in chunk_text(content, chunk_size=chunk_chars, overlap=0):
+                yield {
+                    "messages": [
+                        {"role": "user", "content": f"Write the {language} code in {relative}."},
+                        {"role": "assistant", "content": chunk},
+                    ],
+                    "key": chunk,
+                }
+
+
+def iter_jsonl_samples(path: str) -> Iterator[Dict]:
+    """
+    Instruction samples from JSONL: either {"messages": [...]} or the
+    alpaca-style {"instruction", "input", "output"} used in the notebook.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "messages" in record:
+                messages = record["messages"]
+            else:
+                prompt = record["instruction"]
+                if record.get("input"):
+                    prompt += "\n\n" + record["input"]
+                messages = [
+                    {"role": "user", "content": prompt},
+                    {"role": "assistant", "content": record["output"]},
+                ]
+            yield {"messages": messages, "key": json.dumps(messages, sort_keys=True)}
+
+
+def dedupe(samples: Iterator[Dict], stats: Dict) -> Iterator[Dict]:
+    """
+    Drop exact duplicates (after whitespace normalization).
+
+    Only an 8-byte digest per unique sample is kept in memory.
+    """
+    seen = set()
+    for sample in samples:
+        normalized = re.sub(r"\s+", " ", sample.pop("key")).strip()
+        digest = hashlib.blake2b(normalized.encode(), digest_size=8).digest()
+        if digest in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(digest)
+        sample["digest"] = digest
+        yield sample
+
+
+def _init_worker(tokenizer_name: str):
+    global _tokenizer
+    from transformers import AutoTokenizer
+    _tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, trust_remote_code=True)
+
+
+def _render_and_tokenize(messages: List[Dict]) -> List[int]:
+    """Worker side: apply the chat template and tokenize, ending with EOS."""
+    text = _tokenizer.apply_chat_template(messages, tokenize=False)
+    ids = _tokenizer.encode(text, add_special_tokens=False)
+    if _tokenizer.eos_token_id is not None and (not ids or ids[-1] != _tokenizer.eos_token_id):
+        ids.append(_tokenizer.eos_token_id)
+    return ids
+
+
+class PackedWriter:
+    """
+    Concatenates token streams and appends fixed-length rows to a flat
+    binary file; a trailing partial row is dropped on close.
+    """
+    
+    def __init__(self, path: Path, seq_len: int):
+        self.path = path
+        self.seq_len = seq_len
+        self.buffer = []
+        self.rows = 0
+        self.tokens = 0
+        self.file = open(path, 'wb')
+    
+    def add(self, ids: List[int]):
+        self.buffer.extend(ids)
+        self.tokens += len(ids)
+        full = len(self.buffer) // self.seq_len
+        if full:
+            cut = full * self.seq_len
+            np.asarray(self.buffer[:cut], dtype=TOKEN_DTYPE).tofile(self.file)
+            del self.buffer[:cut]
+            self.rows += full
+    
+    def close(self) -> int:
+        """Returns the number of tokens dropped from the final partial row."""
+        self.file.close()
+        return len(self.buffer)
+
+
+def prepare(
+    roots: List[str],
+    out_dir: str,
+    tokenizer_name: str,
+    seq_len: int = 2048,
+    jsonl: Optional[List[str]] = None,
+    chunk_chars: int = 4000,
+    val_fraction: float = 0.0,
+    workers: Optional[int] = None,
+    window: int = 1024
+) -> Dict:
+    """
+    Build train.bin (and val.bin) of shape [rows, seq_len] plus meta.json.
+
+    Samples are deduplicated in the parent, then rendered and tokenized
+    by a process pool one window at a time.
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    stats = {"duplicates": 0, "samples": 0}
+    
+    def sources():
+        if roots:
+            yield from iter_code_samples(roots, chunk_chars)
+        for path in jsonl or []:
+            yield from iter_jsonl_samples(path)
+    
+    writers = {"train": PackedWriter(out / "train.bin", seq_len)}
+    if val_fraction > 0:
+        writers["val"] = PackedWriter(out / "val.bin", seq_len)
+    # Split on the content digest so a sample always lands in the same split
+    val_cutoff = int(val_fraction * 2 ** 64)
+    
+    start = time.perf_counter()
+    samples = dedupe(sources(), stats)
+    with multiprocessing.get_context("spawn").Pool(
+        workers, initializer=_init_worker, initargs=(tokenizer_name,)
+    ) as pool:
+        while True:
+            batch = list(islice(samples, window))
+            if not batch:
+                break
+            token_lists = pool.map(_render_and_tokenize, [s["messages"] for s in batch],
+                                   chunksize=16)
+            for sample, ids in zip(batch, token_lists):
+                split = "val" if int.from_bytes(sample["digest"], "big") < val_cutoff else "train"
+                writers[split].add(ids)
+            stats["samples"] += len(batch)
+            print(f"\r  {stats['samples']} samples, {writers['train'].rows} rows", end="", flush=True)
+    print()
+    
+    meta = {
+        "seq_len": seq_len,
+        "dtype": np.dtype(TOKEN_DTYPE).name,
+        "tokenizer": tokenizer_name,
+        "samples": stats["samples"],
+        "duplicates_dropped": stats["duplicates"],
+        "seconds": round(time.perf_counter() - start, 2),
+        "splits": {},
+    }
+    for split, writer in writers.items():
+        dropped = writer.close()
+        meta["splits"][split] = {
+            "file": writer.path.name,
+            "rows": writer.rows,
+            "tokens": writer.tokens,
+            "tail_tokens_dropped": dropped,
+        }
+    with open(out / "meta.json", 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class PackedDataset:
+    """
+    Map-style dataset over a packed split, read through np.memmap.
+
+    Rows are paged in from disk on access, so memory use does not grow
+    with the corpus. Works with the Hugging Face Trainer as train_dataset.
+    """
+    
+    def __init__(self, data_dir: str, split: str = "train"):
+        data_dir = Path(data_dir)
+        with open(data_dir / "meta.json") as f:
+            self.meta = json.load(f)
+        info = self.meta["splits"][split]
+        self.seq_len = self.meta["seq_len"]
+        if info["rows"] == 0:
+            # np.memmap cannot map an empty file (e.g. no rows survived dedupe)
+            self.tokens = np.zeros((0, self.seq_len), dtype=self.meta["dtype"])
+        else:
+            self.tokens = np.memmap(data_dir / info["file"], dtype=self.meta["dtype"], mode="r",
+                                    shape=(info["rows"], self.seq_len))
+    
+    def __len__(self):
+        return self.tokens.shape[0]
+    
+    def __getitem__(self, index):
+        import torch
+        
+        ids = torch.from_numpy(self.tokens[index].astype(np.int64))
+        return {"input_ids": ids, "labels": ids.clone(), "attention_mask": torch.ones_like(ids)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("roots", nargs="*", help="Codebases to crawl")
+    parser.add_argument("--jsonl", nargs="*", default=[],
+                        help="Instruction files ({messages} or {instruction, input, output})")
+    parser.add_argument("--out", default="data/packed")
+    parser.add_argument("--model", default="Qwen/Qwen2.5-Coder-7B-Instruct",
+                        help="Tokenizer / chat template to use")
+    parser.add_argument("--seq-len", type=int, default=2048)
+    parser.add_argument("--chunk-chars", type=int, default=4000)
+    parser.add_argument("--val-fraction", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    
+    if not args.roots and not args.jsonl:
+        parser.error("give at least one root or --jsonl file")
+    
+    meta = prepare(args.roots, args.out, args.model, args.seq_len, args.jsonl,
+                   args.chunk_chars, args.val_fraction, args.workers)
+    print(f"\nPacked {meta['samples']} samples ({meta['duplicates_dropped']} duplicates dropped) "
+          f"in {meta['seconds']}s")
+    for split, info in meta["splits"].items():
+        print(f"  {split}: {info['rows']} x {meta['seq_len']} tokens -> {Path(args.out) / info['file']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Evaluation Harness - Execute generated code against unit tests and report pass@k
+Runs candidates in isolated, resource-limited subprocesses with network blocked,
+so quality can be compared across speed settings alongside latency
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from telemetry import telemetry
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:  # Windows: only the wall-clock timeout applies
+    HAS_RESOURCE = False
+
+
+EVAL_SUITE = [
+    {"name": "reverse_words", "entry_point": "reverse_words",
+     "prompt": "Write a Python function reverse_words(s: str) -> str that reverses the order "
+               "of words in s, collapsing runs of whitespace to single spaces.",
+     "tests": "assert reverse_words('hello world') == 'world hello'\n"
+              "assert reverse_words('  a   b c ') == 'c b a'\n"
+              "assert reverse_words('') == ''"},
+    {"name": "merge_intervals", "entry_point": "merge_intervals",
+     "prompt": "Write a Python function merge_intervals(intervals) that merges overlapping "
+               "[start, end] intervals and returns them sorted by start as lists.",
+     "tests": "assert merge_intervals([[1, 3], [2, 6], [8, 10]]) == [[1, 6], [8, 10]]\n"
+              "assert merge_intervals([[5, 6], [1, 2]]) == [[1, 2], [5, 6]]\n"
+              "assert merge_intervals([[1, 4], [4, 5]]) == [[1, 5]]\n"
+              "assert merge_intervals([]) == []"},
+    {"name": "lru_cache", "entry_point": "LRUCache",
+     "prompt": "Write a Python class LRUCache(capacity) with get(key) returning -1 when "
+               "missing and put(key, value) evicting the least recently used key.",
+     "tests": "c = LRUCache(2)\nc.put(1, 1)\nc.put(2, 2)\nassert c.get(1) == 1\n"
+              "c.put(3, 3)\nassert c.get(2) == -1\nc.put(4, 4)\n"
+              "assert c.get(1) == -1\nassert c.get(3) == 3\nassert c.get(4) == 4"},
+    {"name": "is_balanced", "entry_point": "is_balanced",
+     "prompt": "Write a Python function is_balanced(s: str) -> bool that checks whether the "
+               "brackets (), [] and {} in s are balanced; other characters are ignored.",
+     "tests": "assert is_balanced('([]{})')\nassert not is_balanced('([)]')\n"
+              "assert is_balanced('a(b)c')\nassert not is_balanced('((')\nassert is_balanced('')"},
+    {"name": "flatten", "entry_point": "flatten",
+     "prompt": "Write a Python function flatten(items) that flattens arbitrarily nested lists "
+               "and tuples into a flat list, leaving strings intact.",
+     "tests": "assert flatten([1, [2, (3, [4])], 'ab']) == [1, 2, 3, 4, 'ab']\n"
+              "assert flatten([]) == []\nassert flatten([[[]]]) == []"},
+    {"name": "roman_to_int", "entry_point": "roman_to_int",
+     "prompt": "Write a Python function roman_to_int(s: str) -> int converting a Roman "
+               "numeral to an integer.",
+     "tests": "assert roman_to_int('III') == 3\nassert roman_to_int('LVIII') == 58\n"
+              "assert roman_to_int('MCMXCIV') == 1994"},
+    {"name": "chunked", "entry_point": "chunked",
+     "prompt": "Write a Python generator function chunked(iterable, size) that yields lists "
+               "of at most size items; raise ValueError if size < 1.",
+     "tests": "assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]\n"
+              "assert list(chunked([], 3)) == []\n"
+              "try:\n    list(chunked([1], 0))\n    assert False\nexcept ValueError:\n    pass"},
+    {"name": "top_k_frequent", "entry_point": "top_k_frequent",
+     "prompt": "Write a Python function top_k_frequent(words, k) returning the k most frequent "
+               "words, ties broken alphabetically.",
+     "tests": "assert top_k_frequent(['a', 'b', 'a', 'c', 'b', 'a'], 2) == ['a', 'b']\n"
+              "assert top_k_frequent(['x', 'y'], 2) == ['x', 'y']\n"
+              "assert top_k_frequent(['b', 'a', 'b', 'a', 'c'], 1) == ['a']"},
+]
+
+# Runs before the candidate: audit hooks cannot be removed, and the blocked
+# events are bound as a default argument rather than read from a global the
+# candidate could rebind, so it cannot open sockets or start processes
+_SANDBOX_PRELUDE = '''
+import sys
+def _deny(event, args, _blocked=("socket.", "subprocess.Popen", "os.system", "os.exec",
+                                 "os.spawn", "os.posix_spawn", "os.fork", "os.forkpty",
+                                 "pty.spawn")):
+    if event.startswith(_blocked) or (event == "object.__setattr__" and args[1] in (
+            "__code__", "__defaults__", "__kwdefaults__")):
+        raise PermissionError(f"sandbox: {event} is not allowed")
+sys.addaudithook(_deny)
+del _deny, sys
+'''
+
+_CODE_BLOCK = re.compile(r"```([\w+-]*)[^\n]*\n(.*?)```", re.DOTALL)
+
+
+def extract_code(response: str, entry_point: str = "") -> str:
+    """
+    Python code from a model response.
+
+    Prefers the fenced block that defines the entry point, then all Python
+    blocks joined, then the raw response if it has no fences.
+    """
+    blocks = [(lang.lower(), body) for lang, body in _CODE_BLOCK.findall(response)]
+    python = [body for lang, body in blocks if lang in ("", "py", "python", "python3")]
+    if entry_point:
+        definition = re.compile(rf"^\s*(def|class)\s+{re.escape(entry_point)}\b", re.MULTILINE)
+        for body in python:
+            if definition.search(body):
+                return body
+    if python:
+        return "\n\n".join(python)
+    return response if not blocks else ""
+
+
+def pass_at_k(n: int, c: int, k: int) -> float:
+    """Unbiased pass@k estimate from n samples with c correct (Chen et al., 2021)."""
+    if n - c < k:
+        return 1.0
+    return 1.0 - math.comb(n - c, k) / math.comb(n, k)
+
+
+# Sets the limits in the child and then execs the candidate. Running this
+# in the new interpreter avoids preexec_fn, which is not safe in a process
+# that has threads (evaluate() launches candidates from a thread pool)
+_LIMITS_LAUNCHER = '''
+import os, resource, sys
+cpu_seconds, memory_mb, script = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3]
+resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+resource.setrlimit(resource.RLIMIT_AS, (memory_mb * 1024 * 1024,) * 2)
+resource.setrlimit(resource.RLIMIT_FSIZE, (16 * 1024 * 1024,) * 2)
+resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+os.execv(sys.executable, [sys.executable, "-I", script])
+'''
+
+
+def _sandbox_command(script: Path, cpu_seconds: int, memory_mb: int) -> List[str]:
+    if not HAS_RESOURCE:
+        return [sys.executable, "-I", str(script)]
+    return [sys.executable, "-I", "-c", _LIMITS_LAUNCHER,
+            str(cpu_seconds), str(memory_mb), str(script)]
+
+
+def run_candidate(code: str, tests: str, timeout: float = 10.0,
+                  cpu_seconds: int = 10, memory_mb: int = 512) -> Dict:
+    """Execute code + tests in a fresh interpreter inside a throwaway directory."""
+    with tempfile.TemporaryDirectory(prefix="enxio_eval_") as workdir:
+        script = Path(workdir) / "candidate.py"
+        script.write_text(_SANDBOX_PRELUDE + "\n" + code + "\n\n" + tests + "\n", encoding="utf-8")
+        
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            _sandbox_command(script, cpu_seconds, memory_mb),
+            cwd=workdir,
+            env={"PATH": os.environ.get("PATH", ""), "PYTHONHASHSEED": "0"},
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=HAS_RESOURCE,  # own process group, killed as a whole on timeout
+        )
+        try:
+            _, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            if HAS_RESOURCE:
+                os.killpg(proc.pid, signal.SIGKILL)  # the candidate and anything it started
+            else:
+                proc.kill()
+            proc.communicate()
+            return {"passed": False, "error": "timeout", "exec_s": timeout}
+        
+        elapsed = time.perf_counter() - start
+        if proc.returncode == 0:
+            return {"passed": True, "exec_s": elapsed}
+        error = stderr.strip().splitlines()[-1] if stderr.strip() else f"exit {proc.returncode}"
+        return {"passed": False, "error": error[:200], "exec_s": elapsed}
+
+
+def load_generator(backend: str, config_path: str):
+    """Return (generate(prompt) -> str, telemetry prefix, model name) for a backend."""
+    if backend == "qwen":
+        sys.path.insert(0, str(Path(__file__).parent.parent / "qwen_setup"))
+        from qwen_coder import QwenCoder
+        
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        coder = QwenCoder(config['model']['name'])
+        return coder.code, "qwen.generate", config['model']['name']
+    
+    from main import build_coder
+    
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    coder, _ = build_coder(config)
+    use_rag = backend == "rag"
+    temperature = config['generation']['temperature']
+    generate = lambda prompt: coder.generate_novel_code(prompt, use_rag=use_rag,
+                                                        temperature=temperature)
+    return generate, "generate", coder.model_name
+
+
+def evaluate(generate, prefix: str, tasks: List[Dict], samples: int, workers: int,
+             timeout: float, cpu_seconds: int, memory_mb: int) -> Dict:
+    """Generate samples for every task, then execute them all in parallel."""
+    candidates = []
+    for task in tasks:
+        for i in range(samples):
+            tokens_before = telemetry.counters.get(f"{prefix}.tokens_out", 0)
+            start = time.perf_counter()
+            response = generate(task["prompt"])
+            latency = time.perf_counter() - start
+            tokens = telemetry.counters.get(f"{prefix}.tokens_out", 0) - tokens_before
+            candidates.append({
+                "task": task["name"],
+                "sample": i,
+                "latency_s": latency,
+                "tokens": tokens,
+                "code": extract_code(response, task.get("entry_point", "")),
+            })
+            print(f"  {task['name']} #{i + 1}: {latency:.1f}s, {tokens:.0f} tokens")
+    
+    tests = {task["name"]: task["tests"] for task in tasks}
+    print(f"\nExecuting {len(candidates)} candidates on {workers} workers...")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outcomes = pool.map(
+            lambda c: run_candidate(c["code"], tests[c["task"]], timeout, cpu_seconds, memory_mb)
+            if c["code"] else {"passed": False, "error": "no code block", "exec_s": 0.0},
+            candidates,
+        )
+        for candidate, outcome in zip(candidates, outcomes):
+            candidate.update(outcome)
+    
+    return summarize(tasks, candidates, samples)
+
+
+def summarize(tasks: List[Dict], candidates: List[Dict], samples: int) -> Dict:
+    ks = [k for k in (1, 5, 10) if k <= samples]
+    per_task = {}
+    for task in tasks:
+        runs = [c for c in candidates if c["task"] == task["name"]]
+        correct = sum(c["passed"] for c in runs)
+        per_task[task["name"]] = {
+            "correct": correct,
+            "samples": len(runs),
+            **{f"pass@{k}": pass_at_k(len(runs), correct, k) for k in ks},
+            "errors": sorted({c["error"] for c in runs if not c["passed"]}),
+        }
+    
+    latencies = [c["latency_s"] for c in candidates]
+    total_tokens = sum(c["tokens"] for c in candidates)
+    return {
+        "tasks": per_task,
+        **{f"pass@{k}": statistics.mean(t[f"pass@{k}"] for t in per_task.values()) for k in ks},
+        "latency_p50_s": statistics.median(latencies),
+        "latency_p90_s": sorted(latencies)[int(0.9 * (len(latencies) - 1))],
+        "tokens_per_s": total_tokens / sum(latencies) if sum(latencies) else 0.0,
+        "candidates": candidates,
+    }
+
+
+def print_report(result: Dict, settings: Dict):
+    ks = sorted(int(key.split("@")[1]) for key in result if key.startswith("pass@"))
+    print("\n" + "=" * 70)
+    print(" ".join(f"{k}={v}" for k, v in settings.items()))
+    print("=" * 70)
+    print(f"{'task':<20} {'correct':>9} " + " ".join(f"{'pass@' + str(k):>8}" for k in ks))
+    for name, task in result["tasks"].items():
+        print(f"{name:<20} {task['correct']:>4}/{task['samples']:<4} "
+              + " ".join(f"{task[f'pass@{k}']:>8.2f}" for k in ks))
+    print("-" * 70)
+    print(f"{'overall':<20} {'':>9} " + " ".join(f"{result[f'pass@{k}']:>8.2f}" for k in ks))
+    print(f"latency p50 {result['latency_p50_s']:.1f}s, p90 {result['latency_p90_s']:.1f}s, "
+          f"{result['tokens_per_s']:.1f} tokens/sec")
+    print("=" * 70)
+
+
+def load_tasks(path: Optional[str]) -> List[Dict]:
+    if not path:
+        return EVAL_SUITE
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backend", choices=["rag", "plain", "qwen"], default="plain",
+                        help="rag/plain: RAGQwenCoder.generate_novel_code with/without RAG; "
+                             "qwen: qwen_setup QwenCoder.code")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--tasks", default=None,
+                        help="JSONL with name, prompt, tests (and optional entry_point)")
+    parser.add_argument("--samples", type=int, default=1, help="Samples per task (n)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--timeout", type=float, default=10.0, help="Wall-clock seconds per run")
+    parser.add_argument("--cpu-seconds", type=int, default=10)
+    parser.add_argument("--memory-mb", type=int, default=512)
+    parser.add_argument("--output", default="eval_results.json")
+    args = parser.parse_args()
+    
+    tasks = load_tasks(args.tasks)
+    generate, prefix, model_name = load_generator(args.backend, args.config)
+    result = evaluate(generate, prefix, tasks, args.samples, args.workers,
+                      args.timeout, args.cpu_seconds, args.memory_mb)
+    
+    with open(args.config, 'r') as f:
+        config = json.load(f)
+    settings = {
+        "backend": args.backend,
+        "model": model_name,
+        "quantization": config['model'].get('quantization'),
+        "compression": config['rag'].get('compression', {}).get('enabled'),
+        "samples": args.samples,
+    }
+    print_report(result, settings)
+    
+    with open(args.output, 'w') as f:
+        json.dump({"settings": settings, **result}, f, indent=2)
+    print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Job Queue - Background generation jobs for the interactive REPL
+Jobs run on worker threads while the prompt stays usable; a running job is
+cancelled through a stopping criterion, so the loaded model is never lost
+"""
+
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from telemetry import telemetry
+
+
+class CancelCriterion:
+    """
+    Stopping criterion that ends generation once its event is set.
+
+    generate() checks it after every token, so a cancelled job gives up its
+    compute on the next decode step. Any object with is_set() works.
+    """
+    
+    def __init__(self, event):
+        self.event = event
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        return input_ids.new_full((input_ids.shape[0],), self.event.is_set()).bool()
+
+
+class Job:
+    """One queued generation request and its outcome."""
+    
+    def __init__(self, job_id: int, task: str, kind: str, context: Optional[str] = None):
+        self.id = job_id
+        self.task = task
+        self.kind = kind
+        self.context = context  # extra prompt context, e.g. pinned /grep matches
+        self.status = "queued"  # queued, running, done, cancelled, failed
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+    
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+    
+    def describe(self) -> str:
+        task = self.task if len(self.task) <= 50 else self.task[:47] + "..."
+        return f"#{self.id:<3} {self.status:<9} {self.kind:<4} {self.elapsed:6.1f}s  {task}"
+
+
+class JobQueue:
+    """
+    FIFO of generation jobs served by background threads.
+
+    run(job) does the work and should pass job.cancel_event down to
+    generation; notify(job) is called when a job leaves the running state.
+    """
+    
+    def __init__(self, run: Callable[[Job], str], workers: int = 1,
+                 notify: Optional[Callable[[Job], None]] = None):
+        self.run = run
+        self.notify = notify
+        self.jobs: Dict[int, Job] = {}
+        self._queue = deque()
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, daemon=True, name=f"job-worker-{i}")
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+    
+    def submit(self, task: str, kind: str = "code", context: Optional[str] = None) -> Job:
+        with self._cond:
+            job = Job(next(self._ids), task, kind, context)
+            self.jobs[job.id] = job
+            self._queue.append(job)
+            self._cond.notify()
+        telemetry.incr('jobs.submitted')
+        return job
+    
+    def cancel(self, job_id: int) -> bool:
+        """Drop a queued job or stop a running one; False if already finished."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.status not in ("queued", "running"):
+                return False
+            job.cancel_event.set()
+            if job.status == "queued":
+                self._queue.remove(job)
+                job.status = "cancelled"
+                job.finished = time.time()
+        telemetry.incr('jobs.cancelled')
+        return True
+    
+    def running(self) -> List[Job]:
+        return [job for job in self.list() if job.status == "running"]
+    
+    def list(self) -> List[Job]:
+        with self._cond:
+            return list(self.jobs.values())
+    
+    def get(self, job_id: int) -> Optional[Job]:
+        return self.jobs.get(job_id)
+    
+    def close(self):
+        """Cancel everything and stop the workers."""
+        for job in self.list():
+            self.cancel(job.id)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+    
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                job = self._queue.popleft()
+                job.status = "running"
+                job.started = time.time()
+            
+            try:
+                job.result = self.run(job)
+                job.status = "cancelled" if job.cancel_event.is_set() else "done"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            job.finished = time.time()
+            telemetry.observe(f'jobs.{job.status}_s', job.elapsed)
+            
+            if self.notify:
+                self.notify(job)
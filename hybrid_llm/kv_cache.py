@@ -0,0 +1,163 @@
+"""
+KV Cache - Memory-bounded cache strategies for generation
+Quantized (int8/int4) or sliding window with attention sinks, sized per request
+"""
+
+import importlib.util
+from typing import Dict, Optional, Tuple
+
+import torch
+
+
+KV_STRATEGIES = ["dynamic", "quantized", "sink"]
+
+DEFAULT_SETTINGS = {
+    "strategy": "dynamic",
+    "nbits": 4,               # quantized: bits per element, see _BACKEND_NBITS
+    "backend": "quanto",      # quantized: "quanto" (CPU and GPU) or "HQQ"
+    "residual_length": 128,   # quantized: most recent tokens kept at full precision
+    "window": 2048,           # sink: cached tokens after prefill, sinks included
+    "sink_tokens": 4,         # sink: first tokens always kept
+    "budget_mb": None,        # escalate dynamic -> quantized -> sink to stay under this
+}
+
+MB = 1024 ** 2
+
+_BACKEND_MODULES = {"quanto": ("optimum.quanto", "quanto"), "HQQ": ("hqq",)}
+
+# Bit widths each backend's quantized cache accepts
+_BACKEND_NBITS = {"quanto": (2, 4), "HQQ": (1, 2, 3, 4, 8)}
+
+
+def kv_bytes_per_token(model_config, element_bytes: float) -> float:
+    """Keys and values for one token across all layers."""
+    layers = model_config.num_hidden_layers
+    kv_heads = getattr(model_config, "num_key_value_heads", None) or model_config.num_attention_heads
+    head_dim = getattr(model_config, "head_dim", None) \
+        or model_config.hidden_size // model_config.num_attention_heads
+    return 2 * layers * kv_heads * head_dim * element_bytes
+
+
+def _sink_cache_class():
+    try:
+        from transformers import SinkCache
+        return SinkCache
+    except ImportError:  # removed from newer transformers releases
+        return None
+
+
+def _has_backend(backend: str) -> bool:
+    for name in _BACKEND_MODULES.get(backend, ()):
+        try:
+            if importlib.util.find_spec(name):
+                return True
+        except ModuleNotFoundError:  # parent package (e.g. optimum) missing
+            continue
+    return False
+
+
+class KVCachePolicy:
+    """Chooses and configures the KV cache for each generate() call."""
+    
+    def __init__(self, config: Optional[Dict] = None):
+        self.settings = dict(DEFAULT_SETTINGS, **(config or {}))
+        if self.settings["strategy"] not in KV_STRATEGIES:
+            raise ValueError(f"Unknown KV cache strategy: {self.settings['strategy']}")
+        backend, nbits = self.settings["backend"], self.settings["nbits"]
+        if backend not in _BACKEND_NBITS:
+            raise ValueError(f"Unknown KV cache backend: {backend}")
+        if nbits not in _BACKEND_NBITS[backend]:
+            raise ValueError(f"{backend} KV cache supports nbits {_BACKEND_NBITS[backend]}, got {nbits}")
+        self._warned = set()
+    
+    def available(self, strategy: str) -> bool:
+        if strategy == "quantized":
+            return _has_backend(self.settings["backend"])
+        if strategy == "sink":
+            return _sink_cache_class() is not None
+        return True
+    
+    def estimate(self, model_config, strategy: str, prompt_tokens: int,
+                 max_new_tokens: int, element_bytes: float, batch_size: int = 1) -> Dict:
+        """Peak KV cache size for one request (or batch) under a strategy."""
+        total = prompt_tokens + max_new_tokens
+        full = kv_bytes_per_token(model_config, element_bytes)
+        
+        if strategy == "quantized":
+            residual = min(total, self.settings["residual_length"])
+            # Per-group scales and zero points add roughly 1/8 on top of the packed bits
+            packed = kv_bytes_per_token(model_config, self.settings["nbits"] / 8 * 1.125)
+            peak = residual * full + (total - residual) * packed
+            cached = total
+        elif strategy == "sink":
+            # The whole prompt is cached during prefill, then trimmed to the window
+            cached = min(total, self.settings["window"])
+            peak = max(prompt_tokens, cached) * full
+        else:
+            cached = total
+            peak = total * full
+        
+        return {"strategy": strategy, "tokens_cached": cached,
+                "kv_mb": peak * batch_size / MB}
+    
+    def choose(self, model_config, prompt_tokens: int, max_new_tokens: int,
+               element_bytes: float, batch_size: int = 1) -> Dict:
+        """
+        The configured strategy, escalated to cheaper ones while the estimate
+        exceeds budget_mb. Strategies whose dependencies are missing are skipped.
+        """
+        order = KV_STRATEGIES[KV_STRATEGIES.index(self.settings["strategy"]):]
+        budget = self.settings["budget_mb"]
+        estimate = None
+        for strategy in order:
+            if not self.available(strategy):
+                self._warn(strategy)
+                continue
+            estimate = self.estimate(model_config, strategy, prompt_tokens,
+                                     max_new_tokens, element_bytes, batch_size)
+            if budget is None or estimate["kv_mb"] <= budget:
+                return estimate
+        # Nothing fits: use the cheapest strategy we have
+        return estimate or self.estimate(model_config, "dynamic", prompt_tokens,
+                                         max_new_tokens, element_bytes, batch_size)
+    
+    def generate_kwargs(self, model, prompt_tokens: int, max_new_tokens: int,
+                        batch_size: int = 1) -> Tuple[Dict, Dict]:
+        """Extra generate() arguments for this request, plus the size estimate."""
+        element_bytes = torch.finfo(model.dtype).bits / 8 if model.dtype.is_floating_point else 2
+        estimate = self.choose(model.config, prompt_tokens, max_new_tokens,
+                               element_bytes, batch_size)
+        
+        if estimate["strategy"] == "quantized":
+            kwargs = {
+                "cache_implementation": "quantized",
+                "cache_config": {
+                    "backend": self.settings["backend"],
+                    "nbits": self.settings["nbits"],
+                    "residual_length": self.settings["residual_length"],
+                },
+            }
+        elif estimate["strategy"] == "sink":
+            # A fresh cache per call; SinkCache keeps state between steps
+            kwargs = {"past_key_values": _sink_cache_class()(
+                window_length=self.settings["window"],
+                num_sink_tokens=self.settings["sink_tokens"],
+            )}
+        else:
+            kwargs = {}
+        return kwargs, estimate
+    
+    def _warn(self, strategy: str):
+        if strategy in self._warned:
+            return
+        self._warned.add(strategy)
+        if strategy == "quantized":
+            print(f"⚠️  Quantized KV cache needs the {self.settings['backend']} backend "
+                  f"(pip install optimum-quanto); skipping it")
+        else:
+            print("⚠️  This transformers version has no SinkCache; skipping the sink strategy")
+
+
+def describe(estimate: Dict) -> str:
+    return (f"{estimate['strategy']} KV cache, {estimate['tokens_cached']} tokens, "
+            f"~{estimate['kv_mb']:.0f} MB")
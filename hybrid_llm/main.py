@@ -5,16 +5,98 @@ Combines RAG, Web Search, and Offline Verification
 
 import json
 import sys
+from contextlib import nullcontext
 from pathlib import Path
+from job_queue import CancelCriterion, Job, JobQueue
 from rag_coder import RAGQwenCoder
+from sharded_rag import ShardedRAG
 from web_search import WebSearchTool
 from network_monitor import offline_mode
+from profiler import RequestProfiler
+from telemetry import telemetry
+from model_selector import select_from_config, describe
+
+
+def select_model(config: dict, quant_modes=None):
+    """Model and quantization for this machine (auto-selected if enabled, within quant_modes)."""
+    model_name = config['model']['name']
+    quantization = config['model'].get('quantization', '4bit')
+    if config['model'].get('auto_select', False):
+        choice = select_from_config(config, quant_modes)
+        if choice:
+            model_name, quantization = choice['model'], choice['quant']
+            print("\n" + describe(choice))
+        else:
+            print(f"\n⚠️  No cached model fits in available RAM, using {model_name}")
+    return model_name, quantization
+
+
+def build_pool(config: dict):
+    """Load shared weights and fork replica workers if serving.replicas is set."""
+    serving = config.get('serving', {})
+    if not serving.get('replicas'):
+        return None
+    
+    from replica_pool import SHAREABLE_QUANT_MODES, ReplicaPool, load_shared_model
+    from transformers import AutoTokenizer
+    
+    model_name, quantization = select_model(config, SHAREABLE_QUANT_MODES)
+    if quantization not in SHAREABLE_QUANT_MODES:
+        print(f"⚠️  Replica pool cannot share {quantization} weights, using int8")
+        quantization = "int8"
+    model = load_shared_model(model_name, quantization, config['model'].get('snapshot_dir'))
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+    return ReplicaPool(
+        model,
+        tokenizer,
+        model_name,
+        replicas=serving['replicas'],
+        threads_per_replica=serving.get('threads_per_replica'),
+        kv_cache=config['generation'].get('kv_cache'),
+        offline=config['network']['offline_mode']
+    )
+
+
+def build_coder(config: dict, pool=None):
+    """
+    Pick the model for this machine and load the RAG coder (and shards, if
+    configured). With a replica pool the coder reuses the pool's shared model.
+    """
+    if pool is not None:
+        model_name, quantization = pool.model_name, None
+    else:
+        model_name, quantization = select_model(config)
+    
+    rag_config = config['rag']
+    docs_index_path = rag_config.get('docs_index_path', '.rag_cache/docs_index.json')
+    shards = None
+    if rag_config.get('roots'):
+        shards = ShardedRAG(
+            rag_config['roots'],
+            docs_index_path=docs_index_path,
+            index_dir=rag_config.get('index_dir', '.rag_cache/shards'),
+            workers=rag_config.get('shard_workers')
+        )
+    coder = RAGQwenCoder(
+        model_name=model_name,
+        quantization=quantization,
+        snapshot_dir=config['model'].get('snapshot_dir'),
+        compression=rag_config.get('compression'),
+        codebase_path=rag_config['codebase_path'],
+        docs_index_path=docs_index_path,
+        index_path=rag_config.get('index_path'),
+        rag=shards,
+        kv_cache=config['generation'].get('kv_cache'),
+        prompt_lookup=config['generation'].get('prompt_lookup'),
+        model=pool.model if pool is not None else None
+    )
+    return coder, shards
 
 
 class HybridLLM:
     """Complete hybrid system with all features."""
     
-    def __init__(self, config_path: str = "config.json"):
+    def __init__(self, config_path: str = "config.json", profile_requests: int = None):
         print("=" * 70)
         print("Hybrid LLM System - Initializing...")
         print("=" * 70)
@@ -23,19 +105,44 @@ class HybridLLM:
         with open(config_path, 'r') as f:
             self.config = json.load(f)
         
+        telemetry_config = self.config.get('telemetry', {})
+        if telemetry_config.get('jsonl_path'):
+            telemetry.enable_jsonl(telemetry_config['jsonl_path'])
+        if telemetry_config.get('prometheus_port'):
+            telemetry.serve_prometheus(telemetry_config['prometheus_port'])
+        
+        # profile_requests overrides profiling.requests: profile the first N requests
+        profiling = dict(self.config.get('profiling', {}))
+        if profile_requests is not None:
+            profiling['requests'] = profile_requests
+        self.profiler = RequestProfiler(**profiling)
+        
         # Initialize components
         print("\n[1/3] Loading RAG Coder...")
-        self.coder = RAGQwenCoder(
-            model_name=self.config['model']['name'],
-            codebase_path=self.config['rag']['codebase_path']
-        )
+        self.pool = build_pool(self.config)
+        self.coder, self.shards = build_coder(self.config, pool=self.pool)
         
         print("\n[2/3] Initializing Web Search...")
-        self.web_search = WebSearchTool()
+        web_config = self.config.get('web', {})
+        self.ingest_web_docs = web_config.get('ingest_to_rag', False)
+        self.fetch_pages = web_config.get('fetch_pages', 2)
+        self.web_search = WebSearchTool(
+            doc_store=self.coder.rag if self.ingest_web_docs else None
+        )
+        
+        # /grep matches waiting to be added to the next task's prompt
+        self.grep_context = None
         
         print("\n[3/3] Setting up network monitor...")
         self.offline_mode = self.config['network']['offline_mode']
         
+        # One job at a time on a single model; one per worker with a pool
+        self.jobs = JobQueue(
+            self._run_job,
+            workers=self.pool.replicas if self.pool else 1,
+            notify=self._job_finished
+        )
+        
         print("\n" + "=" * 70)
         print("✅ System Ready!")
         print("=" * 70)
@@ -44,7 +151,9 @@ class HybridLLM:
         self,
         task: str,
         use_web: bool = False,
-        use_rag: bool = True
+        use_rag: bool = True,
+        cancel=None,
+        extra_context: str = None
     ) -> str:
         """
         Generate code with optional web search and RAG.
@@ -53,8 +162,15 @@ class HybridLLM:
             task: What to build
             use_web: Search internet for docs/examples
             use_rag: Use local codebase patterns
+            cancel: threading.Event that stops generation when set
+            extra_context: Appended to the task, e.g. pinned /grep matches
         """
-        enhanced_task = task
+        enhanced_task = task + (extra_context or "")
+        
+        # Offline: previously ingested web docs are served by the RAG step
+        if use_web and self.offline_mode:
+            print("\n📴 Offline mode - using cached web docs only")
+            use_web = False
         
         # Add web search context if requested
         if use_web:
@@ -66,26 +182,164 @@ class HybridLLM:
                 for i, result in enumerate(search_results, 1):
                     enhanced_task += f"\n{i}. {result['title']}\n"
                     enhanced_task += f"   {result['snippet']}\n"
+                
+                # Pull full pages into the docs partition for later offline use
+                if self.ingest_web_docs:
+                    for result in search_results[:self.fetch_pages]:
+                        if result['url'].startswith('http'):
+                            self.web_search.fetch_page(result['url'])
         
-        # Generate with RAG
+        # Generate with RAG; only this thread is cut off from the network
         print("\n🧠 Generating code...")
-        result = self.coder.generate_novel_code(
-            enhanced_task,
-            use_rag=use_rag,
-            temperature=self.config['generation']['temperature']
-        )
+        guard = offline_mode() if self.offline_mode else nullcontext()
+        with guard:
+            if self.pool is not None:
+                # Prompt is built here; an idle replica worker generates
+                result = self.pool.generate(
+                    self.coder._build_prompt(enhanced_task, use_rag),
+                    max_new_tokens=self.config['generation']['max_tokens'],
+                    temperature=self.config['generation']['temperature'],
+                    cancel=cancel
+                )
+            else:
+                result = self.coder.generate_novel_code(
+                    enhanced_task,
+                    use_rag=use_rag,
+                    temperature=self.config['generation']['temperature'],
+                    stopping_criteria=[CancelCriterion(cancel)] if cancel else None
+                )
         
         return result
     
+    def _run_job(self, job: Job) -> str:
+        with self.profiler.capture(f"job{job.id}"):
+            return self.generate_code(job.task, use_web=job.kind == "web", use_rag=True,
+                                      cancel=job.cancel_event, extra_context=job.context)
+    
+    def toggle_profiling(self, args):
+        """/profile toggles one request, /profile N arms N, /profile off disarms."""
+        self.profiler.toggle(args)
+        
+        if self.profiler.armed:
+            print(f"🔬 Profiling the next {self.profiler.remaining} request(s) "
+                  f"into {self.profiler.output_dir}/")
+            if self.pool:
+                print("   Generation runs in replica workers; only prompt building is profiled")
+        else:
+            print("Profiling off")
+    
+    def _job_finished(self, job: Job):
+        icon = {"done": "✅", "cancelled": "🛑"}.get(job.status, "❌")
+        detail = f": {job.error}" if job.error else f" - /job {job.id} to show"
+        print(f"\n{icon} Job #{job.id} {job.status} after {job.elapsed:.1f}s{detail}")
+    
+    def show_job(self, args):
+        """Print a job's status and, once finished, its output."""
+        job = self.jobs.get(int(args[0])) if args and args[0].isdigit() else None
+        if job is None:
+            print("Usage: /job <id>  (see /jobs)")
+            return
+        print(job.describe())
+        if job.error:
+            print(f"Error: {job.error}")
+        elif job.result is not None:
+            if job.status == "cancelled":
+                print("(partial output, cancelled)")
+            print("\n" + "=" * 70)
+            print(job.result)
+            print("=" * 70)
+    
+    def cancel_jobs(self, args):
+        """Cancel the given job ids, or every running job."""
+        if args:
+            ids = [int(a) for a in args if a.isdigit()]
+        else:
+            ids = [job.id for job in self.jobs.running()]
+        if not ids:
+            print("No running jobs")
+        for job_id in ids:
+            if self.jobs.cancel(job_id):
+                print(f"🛑 Cancelling job #{job_id}")
+            else:
+                print(f"Job #{job_id} is not queued or running")
+    
+    def submit_job(self, task: str, kind: str):
+        job = self.jobs.submit(task, kind, context=self.grep_context)
+        if self.grep_context:
+            print("📌 Pinned /grep matches added to this task")
+            self.grep_context = None
+        queued = sum(j.status == "queued" for j in self.jobs.list())
+        print(f"📋 Job #{job.id} queued ({queued} waiting) - /jobs to list, /cancel {job.id} to stop")
+    
+    def grep_code(self, args: str):
+        """
+        /grep [-F] [-i] <pattern>: regex (or literal, -F) search of the code
+        index. Matches are pinned and added to the next generation task.
+        """
+        literal = ignore_case = False
+        while args[:3] in ("-F ", "-i "):
+            literal |= args[:3] == "-F "
+            ignore_case |= args[:3] == "-i "
+            args = args[3:].lstrip()
+        if args == "off":
+            self.grep_context = None
+            print("Pinned /grep matches dropped")
+            return
+        if not args:
+            print("Usage: /grep [-F] [-i] <pattern>  |  /grep off")
+            return
+        
+        matches = self.coder.rag.grep(args, literal=literal, ignore_case=ignore_case)
+        if not matches:
+            print("No matches")
+            return
+        for match in matches:
+            location = f"{match['shard']}:{match['path']}" if 'shard' in match else match['path']
+            print(f"  {location}: {match['text'][:100]}")
+        
+        self.grep_context = f"\n\n## Matches for `{args}`:\n"
+        for match in matches[:self.config['rag'].get('grep_context_matches', 5)]:
+            self.grep_context += f"\n### {match['path']}\n```{match['language']}\n{match['content']}\n```\n"
+        print("📌 Matches pinned for the next task (/grep off to drop)")
+    
+    def manage_shards(self, args):
+        """List shards, or enable/disable/refresh one by name."""
+        if len(args) == 2 and args[1] in self.shards.shards:
+            action, name = args
+            if action == "enable":
+                self.shards.enable(name)
+            elif action == "disable":
+                self.shards.disable(name)
+            elif action == "refresh":
+                self.shards.refresh(name)
+            else:
+                print(f"Unknown shard action: {action}")
+        elif args:
+            print("Usage: /shards [enable|disable|refresh <name>]")
+        
+        for shard in self.shards.status():
+            state = "on " if shard['enabled'] else "off"
+            print(f"  [{state}] {shard['name']:<20} {shard['files']:>6} files  {shard['path']}")
+    
     def interactive_mode(self):
         """Interactive coding assistant."""
         print("\n" + "=" * 70)
         print("Commands:")
-        print("  /code <task>       - Generate code (RAG only)")
-        print("  /web <task>        - Generate with web search")
+        print("  /code <task>       - Generate code in the background (RAG only)")
+        print("  /web <task>        - Generate with web search in the background")
+        print("  /jobs              - List background jobs")
+        print("  /job <id>          - Show a job's status and output")
+        print("  /cancel [id ...]   - Cancel jobs (default: all running; also Ctrl-C)")
         print("  /search <query>    - Search web only")
+        print("  /grep [-F] [-i] <pattern> - Regex/literal code search; pins matches for the next task")
         print("  /offline           - Toggle offline mode")
         print("  /config            - Show current config")
+        print("  /stats             - Show per-stage timings")
+        print("  /profile [N|off]   - Profile the next N requests (torch + cProfile)")
+        if self.shards:
+            print("  /shards [enable|disable|refresh <name>] - Manage codebase shards")
+        if self.pool:
+            print("  /workers           - Replica throughput and utilization")
         print("  /quit              - Exit")
         print("=" * 70)
         
@@ -101,48 +355,85 @@ class HybridLLM:
                     print("Goodbye!")
                     break
                 
+                elif user_input == "/jobs":
+                    jobs = self.jobs.list()
+                    if not jobs:
+                        print("No jobs yet")
+                    for job in jobs:
+                        print("  " + job.describe())
+                
+                elif user_input.startswith("/job "):
+                    self.show_job(user_input.split()[1:])
+                
+                elif user_input.startswith("/cancel"):
+                    self.cancel_jobs(user_input.split()[1:])
+                
                 elif user_input == "/config":
                     print(json.dumps(self.config, indent=2))
                 
+                elif user_input == "/stats":
+                    telemetry.record_memory()
+                    print(telemetry.summary())
+                
+                elif user_input.startswith("/profile"):
+                    self.toggle_profiling(user_input.split()[1:])
+                
+                elif user_input == "/workers" and self.pool:
+                    print(self.pool.summary())
+                
+                elif user_input.startswith("/shards") and self.shards:
+                    self.manage_shards(user_input.split()[1:])
+                
                 elif user_input == "/offline":
                     self.offline_mode = not self.offline_mode
                     status = "ON" if self.offline_mode else "OFF"
                     print(f"Offline mode: {status}")
                 
+                elif user_input.startswith("/grep"):
+                    self.grep_code(user_input[5:].strip())
+                
                 elif user_input.startswith("/search "):
                     query = user_input[8:]
-                    results = self.web_search.search_duckduckgo(query)
+                    with self.profiler.capture("search"):
+                        results = self.web_search.search_duckduckgo(query)
                     for i, r in enumerate(results, 1):
                         print(f"\n{i}. {r['title']}")
                         print(f"   {r['url']}")
                         print(f"   {r['snippet']}")
                 
                 elif user_input.startswith("/code "):
-                    task = user_input[6:]
-                    result = self.generate_code(task, use_web=False, use_rag=True)
-                    print("\n" + "=" * 70)
-                    print(result)
-                    print("=" * 70)
+                    self.submit_job(user_input[6:], "code")
                 
                 elif user_input.startswith("/web "):
-                    task = user_input[5:]
-                    result = self.generate_code(task, use_web=True, use_rag=True)
-                    print("\n" + "=" * 70)
-                    print(result)
-                    print("=" * 70)
+                    self.submit_job(user_input[5:], "web")
                 
                 else:
                     # Default: treat as code generation task
-                    result = self.generate_code(user_input, use_web=False, use_rag=True)
-                    print("\n" + "=" * 70)
-                    print(result)
-                    print("=" * 70)
-                
+                    self.submit_job(user_input, "code")
+            
             except KeyboardInterrupt:
+                # Ctrl-C stops running jobs; the model stays loaded
+                if self.jobs.running():
+                    print()
+                    self.cancel_jobs([])
+                    continue
+                print("\nGoodbye!")
+                break
+            except EOFError:
                 print("\nGoodbye!")
                 break
             except Exception as e:
                 print(f"Error: {e}")
+        
+        self.close()
+    
+    def close(self):
+        """Stop background jobs, then the shard and replica worker processes."""
+        self.jobs.close()
+        if self.shards:
+            self.shards.close()
+        if self.pool:
+            self.pool.close()
 
 
 def main():
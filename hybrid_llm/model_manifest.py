@@ -0,0 +1,186 @@
+"""
+Model Manifest - Fast, incremental integrity checks for cached models
+Records expected shards, sizes and hashes; re-hashes only changed files
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+HF_CACHE = Path.home() / ".cache" / "huggingface" / "hub"
+
+# LFS blobs in the Hugging Face cache are named after their sha256
+_SHA256_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+_HASH_CHUNK = 8 * 1024 * 1024
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def expected_weight_files(snapshot: Path) -> List[str]:
+    """Weight files a complete snapshot must contain (all shards if sharded)."""
+    for index_name in ("model.safetensors.index.json", "pytorch_model.bin.index.json"):
+        index_path = snapshot / index_name
+        if index_path.exists():
+            with open(index_path) as f:
+                weight_map = json.load(f).get("weight_map", {})
+            return sorted(set(weight_map.values()))
+    
+    for single in ("model.safetensors", "pytorch_model.bin"):
+        if (snapshot / single).exists():
+            return [single]
+    return []
+
+
+class ModelManifest:
+    """Per-model record of weight files, verified in parallel."""
+    
+    def __init__(self, cache_dir: Path = HF_CACHE, manifest_path: Optional[Path] = None):
+        self.cache_dir = Path(cache_dir)
+        self.manifest_path = Path(manifest_path or self.cache_dir / ".enxio_manifest.json")
+        self.entries = {}
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+    
+    def save(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+    
+    def cached_models(self, prefix: str = "models--Qwen") -> List[str]:
+        if not self.cache_dir.exists():
+            return []
+        return sorted(
+            entry.name[len("models--"):].replace("--", "/")
+            for entry in os.scandir(self.cache_dir)
+            if entry.is_dir() and entry.name.startswith(prefix)
+        )
+    
+    def model_dir(self, model_name: str) -> Path:
+        return self.cache_dir / ("models--" + model_name.replace("/", "--"))
+    
+    def snapshot_dir(self, model_name: str) -> Optional[Path]:
+        """Snapshot pointed to by refs/main, else the most recent one."""
+        model_dir = self.model_dir(model_name)
+        ref = model_dir / "refs" / "main"
+        if ref.exists():
+            snapshot = model_dir / "snapshots" / ref.read_text().strip()
+            if snapshot.exists():
+                return snapshot
+        
+        snapshots = model_dir / "snapshots"
+        if not snapshots.exists():
+            return None
+        candidates = [Path(e.path) for e in os.scandir(snapshots) if e.is_dir()]
+        return max(candidates, key=lambda p: p.stat().st_mtime) if candidates else None
+    
+    def check(self, model_name: str, verify_hashes: bool = True, workers: int = 4) -> Dict:
+        """
+        Check one model's weights and update its manifest entry.
+
+        Files whose size and mtime match the manifest are not re-read, so
+        repeated checks cost one stat() per shard. With verify_hashes=False
+        only presence and sizes are checked.
+        """
+        previous = self.entries.get(model_name, {}).get("files", {})
+        entry = {"status": "missing", "files": {}, "problems": [], "checked_at": time.time()}
+        
+        snapshot = self.snapshot_dir(model_name)
+        if snapshot is None:
+            entry["problems"].append("no snapshot in cache")
+            self.entries[model_name] = entry
+            return entry
+        entry["revision"] = snapshot.name
+        
+        blobs = self.model_dir(model_name) / "blobs"
+        if blobs.exists() and any(e.name.endswith(".incomplete") for e in os.scandir(blobs)):
+            entry["problems"].append("interrupted download (.incomplete blobs present)")
+        
+        expected = expected_weight_files(snapshot)
+        entry["expected"] = expected
+        if not expected:
+            entry["problems"].append("no weight files or index found")
+        
+        to_hash = []
+        for name in expected:
+            path = snapshot / name
+            if not path.exists():
+                entry["problems"].append(f"missing shard {name}")
+                continue
+            
+            blob = path.resolve()
+            stat = blob.stat()
+            record = {"blob": blob.name, "size": stat.st_size, "mtime": stat.st_mtime}
+            old = previous.get(name)
+            if old and old.get("verified") and old["size"] == stat.st_size \
+                    and old["mtime"] == stat.st_mtime and old["blob"] == blob.name:
+                record["verified"] = True
+                record["sha256"] = old.get("sha256")
+            elif verify_hashes:
+                to_hash.append((name, blob))
+            entry["files"][name] = record
+        
+        if to_hash:
+            # hashlib releases the GIL on large buffers, so threads scale
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                digests = pool.map(lambda item: (item[0], _sha256(item[1])), to_hash)
+                for name, digest in digests:
+                    record = entry["files"][name]
+                    record["sha256"] = digest
+                    # Without symlinks the blob name is not a hash; trust the first read
+                    expected_digest = record["blob"] if _SHA256_NAME.match(record["blob"]) else digest
+                    record["verified"] = digest == expected_digest
+                    if not record["verified"]:
+                        entry["problems"].append(f"hash mismatch in {name}")
+        
+        if entry["problems"]:
+            entry["status"] = "incomplete"
+        elif all(f.get("verified") for f in entry["files"].values()):
+            entry["status"] = "complete"
+        else:
+            entry["status"] = "unverified"
+        entry["size"] = sum(f["size"] for f in entry["files"].values())
+        
+        self.entries[model_name] = entry
+        return entry
+    
+    def check_all(self, verify_hashes: bool = True, workers: int = 4) -> Dict[str, Dict]:
+        results = {
+            name: self.check(name, verify_hashes=verify_hashes, workers=workers)
+            for name in self.cached_models()
+        }
+        self.save()
+        return results
+
+
+def main():
+    """Verify every cached Qwen model."""
+    manifest = ModelManifest()
+    start = time.perf_counter()
+    for name, entry in manifest.check_all().items():
+        print(f"{entry['status']:<12} {name} ({entry['size'] / 1024 ** 3:.2f} GB)")
+        for problem in entry["problems"]:
+            print(f"             - {problem}")
+    print(f"\nChecked in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
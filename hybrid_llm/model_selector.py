@@ -0,0 +1,291 @@
+"""
+Model Selector - Pick a model and quantization that fits this machine
+Estimates weights + KV cache + overhead against available RAM
+"""
+
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+HF_CACHE = Path.home() / ".cache" / "huggingface" / "hub"
+
+# Quantization modes; "8bit" and "4bit" are bitsandbytes and need CUDA
+QUANT_MODES = ["none", "int8", "8bit", "4bit"]
+GPU_QUANT_MODES = ("8bit", "4bit")
+
+# Approximate bytes per parameter for each mode (4-bit includes NF4 scales)
+BYTES_PER_PARAM = {"none": 4.0, "int8": 1.05, "8bit": 1.1, "4bit": 0.6}
+
+# Decoding is memory-bandwidth bound, so bytes read per token rank the options
+# by speed. Without the fused kernel, int8 also writes and re-reads an fp32
+# copy of every weight block it dequantizes
+UNFUSED_INT8_BYTES_PER_PARAM = 1.05 + 2 * 4.0
+
+# GPU memory bandwidth relative to a desktop CPU's, for the bitsandbytes modes
+GPU_BANDWIDTH_RATIO = 10.0
+
+# Bytes per KV element: fp32 compute on CPU paths, fp16 for bitsandbytes
+KV_BYTES = {"none": 4, "int8": 4, "8bit": 2, "4bit": 2}
+
+# Qwen2.5-Coder shapes, used when the model's config.json is not cached
+KNOWN_ARCHITECTURES = {
+    0.5: {"params": 0.49e9, "num_hidden_layers": 24, "num_key_value_heads": 2, "head_dim": 64},
+    1.5: {"params": 1.54e9, "num_hidden_layers": 28, "num_key_value_heads": 2, "head_dim": 128},
+    3: {"params": 3.09e9, "num_hidden_layers": 36, "num_key_value_heads": 2, "head_dim": 128},
+    7: {"params": 7.61e9, "num_hidden_layers": 28, "num_key_value_heads": 4, "head_dim": 128},
+    14: {"params": 14.7e9, "num_hidden_layers": 48, "num_key_value_heads": 8, "head_dim": 128},
+}
+
+# Runtime, tokenizer and activation overhead on top of weights and KV cache
+BASE_OVERHEAD_BYTES = 0.8 * 1024 ** 3
+
+GB = 1024 ** 3
+
+
+def torch_capabilities() -> Dict[str, bool]:
+    """Whether CUDA (for bitsandbytes) and the fused int8 CPU kernel are available."""
+    try:
+        import torch
+    except ImportError:
+        return {"cuda": False, "fused_int8": False}
+    return {
+        "cuda": torch.cuda.is_available(),
+        "fused_int8": hasattr(torch.ops.aten, "_weight_int8pack_mm"),
+    }
+
+
+def decode_cost(params: float, quant: str, capabilities: Dict[str, bool]) -> float:
+    """Relative time per decoded token: weight bytes read, scaled for GPU bandwidth."""
+    bytes_per_param = BYTES_PER_PARAM[quant]
+    if quant == "int8" and not capabilities["fused_int8"]:
+        bytes_per_param = UNFUSED_INT8_BYTES_PER_PARAM
+    cost = params * bytes_per_param
+    return cost / GPU_BANDWIDTH_RATIO if quant in GPU_QUANT_MODES else cost
+
+
+def available_memory() -> Optional[int]:
+    """Bytes of RAM available to a new allocation, if it can be determined."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+
+    if sys.platform == "win32":
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("sullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def cache_dir_for(model_name: str, cache_dir: Path = HF_CACHE) -> Path:
+    return cache_dir / ("models--" + model_name.replace("/", "--"))
+
+
+def cached_size(model_name: str, cache_dir: Path = HF_CACHE) -> Optional[int]:
+    """On-disk size of the cached weights, or None if not cached."""
+    blobs = cache_dir_for(model_name, cache_dir) / "blobs"
+    if not blobs.exists():
+        return None
+    return sum(entry.stat().st_size for entry in os.scandir(blobs) if entry.is_file())
+
+
+def model_architecture(model_name: str, cache_dir: Path = HF_CACHE) -> Optional[Dict]:
+    """Shape parameters from the cached config.json, or the known table."""
+    snapshots = cache_dir_for(model_name, cache_dir) / "snapshots"
+    for config_path in snapshots.glob("*/config.json"):
+        try:
+            with open(config_path) as f:
+                config = json.load(f)
+            hidden = config["hidden_size"]
+            heads = config["num_attention_heads"]
+            layers = config["num_hidden_layers"]
+            kv_heads = config.get("num_key_value_heads", heads)
+            head_dim = hidden // heads
+            embeddings = config["vocab_size"] * hidden
+            if not config.get("tie_word_embeddings", False):
+                embeddings *= 2
+            per_layer = (2 * hidden * hidden + 2 * hidden * kv_heads * head_dim
+                         + 3 * hidden * config["intermediate_size"])
+            return {
+                "params": embeddings + layers * per_layer,
+                "num_hidden_layers": layers,
+                "num_key_value_heads": kv_heads,
+                "head_dim": head_dim,
+            }
+        except (OSError, ValueError, KeyError):
+            continue
+    return _known_architecture(model_name)
+
+
+def _known_architecture(model_name: str) -> Optional[Dict]:
+    match = re.search(r"(\d+(?:\.\d+)?)B", model_name)
+    if not match:
+        return None
+    size = float(match.group(1))
+    return KNOWN_ARCHITECTURES.get(int(size) if size.is_integer() else size)
+
+
+def estimate_footprint(arch: Dict, quant: str, context_tokens: int) -> Dict:
+    """Estimate runtime memory in bytes for one model/quantization pair."""
+    weights = arch["params"] * BYTES_PER_PARAM[quant]
+    kv_cache = (2 * arch["num_hidden_layers"] * arch["num_key_value_heads"]
+                * arch["head_dim"] * KV_BYTES[quant] * context_tokens)
+    total = weights + kv_cache + BASE_OVERHEAD_BYTES
+    return {"weights": weights, "kv_cache": kv_cache, "total": total}
+
+
+class ModelSelector:
+    """Choose the fastest configured model/quantization pair that fits in memory."""
+
+    def __init__(
+        self,
+        candidates: List[str],
+        max_tokens: int = 2048,
+        prompt_tokens: int = 4096,
+        headroom: float = 0.85,
+        require_cached: bool = True,
+        cache_dir: Path = HF_CACHE,
+        quant_modes: Optional[List[str]] = None
+    ):
+        self.candidates = list(dict.fromkeys(candidates))
+        self.quant_modes = [q for q in QUANT_MODES if quant_modes is None or q in quant_modes]
+        self.context_tokens = max_tokens + prompt_tokens
+        self.headroom = headroom
+        self.require_cached = require_cached
+        self.cache_dir = cache_dir
+        self.capabilities = torch_capabilities()
+
+    def options(self, available: Optional[int]) -> List[Dict]:
+        """Every loadable model/quantization pair with its estimates and fit verdict."""
+        budget = available * self.headroom if available else None
+        modes = [q for q in self.quant_modes
+                 if self.capabilities["cuda"] or q not in GPU_QUANT_MODES]
+        options = []
+        for name in self.candidates:
+            arch = model_architecture(name, self.cache_dir)
+            if arch is None:
+                continue
+            disk = cached_size(name, self.cache_dir)
+            for quant in modes:
+                estimate = estimate_footprint(arch, quant, self.context_tokens)
+                options.append({
+                    "model": name,
+                    "quant": quant,
+                    "params": arch["params"],
+                    "cached": disk is not None,
+                    "disk_bytes": disk,
+                    "estimate": estimate,
+                    "decode_cost": decode_cost(arch["params"], quant, self.capabilities),
+                    "fits": budget is None or estimate["total"] <= budget,
+                })
+        return options
+
+    def select(self) -> Optional[Dict]:
+        available = available_memory()
+        usable = [
+            o for o in self.options(available)
+            if o["fits"] and (o["cached"] or not self.require_cached)
+        ]
+        if not usable:
+            return None
+
+        # Fastest expected decoding first; equal speed goes to the bigger model
+        usable.sort(key=lambda o: (o["decode_cost"], -o["params"]))
+        choice = dict(usable[0])
+        choice["available_bytes"] = available
+        choice["cpu_count"] = os.cpu_count()
+        return choice
+
+
+def describe(choice: Dict) -> str:
+    """One-paragraph startup report for a selection."""
+    est = choice["estimate"]
+    available = choice.get("available_bytes")
+    lines = [
+        f"Auto-selected {choice['model']} ({choice['quant']}), the fastest option that fits",
+        f"  Estimated RAM: {est['total'] / GB:.1f} GB "
+        f"(weights {est['weights'] / GB:.1f} GB, KV cache {est['kv_cache'] / GB:.2f} GB)",
+        f"  Available RAM: {available / GB:.1f} GB" if available else "  Available RAM: unknown",
+        f"  CPU cores: {choice.get('cpu_count')}",
+    ]
+    if choice["disk_bytes"] is not None:
+        lines.append(f"  Cached on disk: {choice['disk_bytes'] / GB:.1f} GB")
+    else:
+        lines.append("  Not cached - will download on first load")
+    return "\n".join(lines)
+
+
+def select_from_config(config: Dict, quant_modes: Optional[List[str]] = None) -> Optional[Dict]:
+    """Run the selector over the models listed in config.json, optionally limited to some modes."""
+    model_config = config["model"]
+    candidates = [model_config["name"]] + list(model_config.get("alternatives", {}).values())
+    selector = ModelSelector(
+        candidates,
+        max_tokens=config.get("generation", {}).get("max_tokens", 2048),
+        require_cached=config.get("network", {}).get("offline_mode", True),
+        quant_modes=quant_modes,
+    )
+    return selector.select()
+
+
+def main():
+    """Show every option and the selection for this machine."""
+    with open("config.json") as f:
+        config = json.load(f)
+
+    available = available_memory()
+    model_config = config["model"]
+    candidates = [model_config["name"]] + list(model_config.get("alternatives", {}).values())
+    selector = ModelSelector(candidates, max_tokens=config["generation"]["max_tokens"],
+                             require_cached=False)
+
+    print("=" * 70)
+    print("Model Options")
+    print("=" * 70)
+    for o in selector.options(available):
+        status = "✅ fits" if o["fits"] else "❌ too big"
+        cached = "cached" if o["cached"] else "not cached"
+        print(f"  {o['model']:<40} {o['quant']:<5} "
+              f"{o['estimate']['total'] / GB:6.1f} GB  {o['decode_cost'] / GB:6.1f} GB/token  "
+              f"{status}  ({cached})")
+
+    choice = select_from_config(config)
+    print("\n" + (describe(choice) if choice else "❌ No configured model fits"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Near Duplicates - MinHash signatures and LSH lookup for source files
+One-permutation MinHash keeps hashing to a single pass over the shingles,
+so signatures are cheap enough to compute for every indexed file
+"""
+
+import hashlib
+import re
+from typing import Dict, List, Optional
+
+
+NUM_PERM = 64
+BANDS = 16                   # 4 rows per band: pairs above ~0.5 similarity become candidates
+DUPLICATE_THRESHOLD = 0.8    # indexing: collapse files at least this similar
+DIVERSITY_THRESHOLD = 0.7    # querying: drop results this similar to a better one
+SHINGLE_TOKENS = 5
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_MASK = (1 << 64) - 1
+
+
+def shingles(text: str, k: int = SHINGLE_TOKENS) -> set:
+    """64-bit hashes of k-token windows; whitespace and layout are ignored."""
+    tokens = _TOKEN.findall(text)
+    if not tokens:
+        return set()
+    windows = (" ".join(tokens[i:i + k]) for i in range(max(1, len(tokens) - k + 1)))
+    return {
+        int.from_bytes(hashlib.blake2b(w.encode(), digest_size=8).digest(), "little")
+        for w in windows
+    }
+
+
+def minhash(text: str, num_perm: int = NUM_PERM) -> Optional[List[int]]:
+    """
+    One-permutation MinHash with rotation densification.
+
+    Each shingle hash picks a bin with its low bits and competes for the
+    bin's minimum with the rest; empty bins borrow from the next filled bin
+    on the right, offset by the distance so borrowed values stay distinct.
+    Text without tokens has no signature (None): empty files are not
+    duplicates of each other.
+    """
+    bins = [None] * num_perm
+    for h in shingles(text):
+        slot, value = h % num_perm, h // num_perm
+        if bins[slot] is None or value < bins[slot]:
+            bins[slot] = value
+    
+    if all(v is None for v in bins):
+        return None
+    signature = []
+    for slot in range(num_perm):
+        distance = 0
+        while bins[(slot + distance) % num_perm] is None:
+            distance += 1
+        signature.append((bins[(slot + distance) % num_perm] + distance * 0x9E3779B97F4A7C15) & _MASK)
+    return signature
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class LSHIndex:
+    """Banded LSH over MinHash signatures; candidates are verified before matching."""
+    
+    def __init__(self, bands: int = BANDS, threshold: float = DUPLICATE_THRESHOLD):
+        self.bands = bands
+        self.threshold = threshold
+        self.buckets: Dict[tuple, List[str]] = {}
+        self.signatures: Dict[str, List[int]] = {}
+    
+    def _keys(self, signature: List[int]):
+        rows = len(signature) // self.bands
+        for band in range(self.bands):
+            yield (band, *signature[band * rows:(band + 1) * rows])
+    
+    def add(self, key: str, signature: List[int]):
+        self.signatures[key] = signature
+        for bucket in self._keys(signature):
+            self.buckets.setdefault(bucket, []).append(key)
+    
+    def match(self, signature: List[int]) -> Optional[str]:
+        """Most similar indexed key at or above the threshold, if any."""
+        candidates = {key for bucket in self._keys(signature) for key in self.buckets.get(bucket, ())}
+        best, best_score = None, self.threshold
+        for key in candidates:
+            score = similarity(signature, self.signatures[key])
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+
+def diversify(results: List[Dict], top_k: int,
+              threshold: float = DIVERSITY_THRESHOLD) -> List[Dict]:
+    """
+    Keep the best-ranked result of each group of near-identical snippets.
+
+    results must already be sorted best first; dropped snippets are listed
+    under the kept result's 'copies'. Empty snippets are never grouped.
+    """
+    kept, signatures = [], []
+    for result in results:
+        signature = minhash(result['content'])
+        for other, other_signature in zip(kept, signatures):
+            if signature is None or other_signature is None:
+                continue
+            if similarity(signature, other_signature) >= threshold:
+                other.setdefault('copies', []).append(result['path'])
+                break
+        else:
+            kept.append(result)
+            signatures.append(signature)
+            if len(kept) == top_k:
+                break
+    return kept
@@ -4,40 +4,94 @@ Network Monitor - Verify Qwen runs offline with no data leaks
 
 import socket
 import sys
+import threading
+from collections import Counter
 from contextlib import contextmanager
+from contextvars import ContextVar
+
+from telemetry import telemetry
+
+
+# Audit events raised by the socket module before any traffic can happen
+BLOCKED_EVENTS = frozenset({
+    'socket.__new__',
+    'socket.connect',
+    'socket.bind',
+    'socket.getaddrinfo',
+    'socket.gethostbyname',
+    'socket.gethostbyaddr',
+    'socket.getnameinfo',
+    'socket.sendto',
+    'socket.sendmsg',
+})
+
+# Offline flag for the current thread / async task. New threads start with
+# a fresh context, so they are never affected by another thread's block.
+_offline = ContextVar('offline', default=False)
+
+_hook_lock = threading.Lock()
+_hook_installed = False
+_blocked_attempts = Counter()
+
+
+def _audit_hook(event, args):
+    if event in BLOCKED_EVENTS and _offline.get():
+        with _hook_lock:
+            _blocked_attempts[event] += 1
+        telemetry.incr('network.blocked_attempts')
+        print(f"🚫 Blocked {event} in offline context", file=sys.stderr)
+        raise RuntimeError(
+            "🚫 NETWORK ACCESS BLOCKED!\n"
+            "The model tried to connect to the internet.\n"
+            "This should NOT happen in offline mode."
+        )
+
+
+def _install_hook():
+    """Audit hooks cannot be removed, so install exactly once."""
+    global _hook_installed
+    with _hook_lock:
+        if not _hook_installed:
+            sys.addaudithook(_audit_hook)
+            _hook_installed = True
+
+
+def blocked_attempts() -> dict:
+    """Blocked socket operations so far, by audit event."""
+    with _hook_lock:
+        return dict(_blocked_attempts)
 
 
 class NetworkBlocker:
-    """Block all network access to verify offline operation."""
+    """
+    Block network access for the current thread or async task only.
+
+    Other threads (web prefetch, servers) keep working while the
+    blocked context runs inference. block() and unblock() must be called
+    from the same thread.
+    """
     
     def __init__(self):
-        self.original_socket = None
+        self.token = None
         self.blocked = False
     
     def block(self):
-        """Block all network connections."""
+        """Block network connections in this context."""
         if self.blocked:
             return
         
-        self.original_socket = socket.socket
-        
-        def blocked_socket(*args, **kwargs):
-            raise RuntimeError(
-                "🚫 NETWORK ACCESS BLOCKED!\n"
-                "The model tried to connect to the internet.\n"
-                "This should NOT happen in offline mode."
-            )
-        
-        socket.socket = blocked_socket
+        _install_hook()
+        self.token = _offline.set(True)
         self.blocked = True
         print("✅ Network blocker activated - Model is offline")
     
     def unblock(self):
-        """Restore network access."""
+        """Restore network access in this context."""
         if not self.blocked:
             return
         
-        socket.socket = self.original_socket
+        _offline.reset(self.token)
+        self.token = None
         self.blocked = False
         print("🌐 Network access restored")
 
@@ -63,6 +117,20 @@ def verify_offline():
     blocker.block()
     
     try:
+        # Another thread is not affected by this thread's block
+        other_thread = {}
+        
+        def open_socket():
+            try:
+                socket.socket(socket.AF_INET, socket.SOCK_STREAM).close()
+                other_thread['ok'] = True
+            except RuntimeError:
+                other_thread['ok'] = False
+        
+        worker = threading.Thread(target=open_socket)
+        worker.start()
+        worker.join()
+        
         # Try to make a connection (should fail)
         test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         print("❌ FAILED: Network is still accessible!")
@@ -70,6 +138,10 @@ def verify_offline():
     except RuntimeError as e:
         print("✅ SUCCESS: Network is blocked")
         print(f"   Error message: {str(e)[:50]}...")
+        if not other_thread.get('ok'):
+            print("❌ FAILED: Block leaked into another thread")
+            return False
+        print("✅ SUCCESS: Other threads keep network access")
         return True
     finally:
         blocker.unblock()
@@ -0,0 +1,122 @@
+"""
+Profiler - On-demand capture of the next N requests
+Operator-level PyTorch profile (Chrome trace JSON) plus cProfile (pstats)
+for the Python side: tokenizer, retrieval, web search. Disarmed it costs
+one integer check per request.
+"""
+
+import cProfile
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import List
+
+from telemetry import telemetry
+
+
+class RequestProfiler:
+    """
+    Profiles requests wrapped in capture() while armed.
+
+    One capture runs at a time; requests that overlap it (other background
+    jobs) run unprofiled and do not use up the armed count.
+    """
+    
+    def __init__(self, output_dir: str = "profiles", requests: int = 0, top: int = 10):
+        self.output_dir = Path(output_dir)
+        self.remaining = requests
+        self.top = top
+        self._lock = threading.Lock()
+    
+    @property
+    def armed(self) -> bool:
+        return self.remaining > 0
+    
+    def arm(self, requests: int = 1):
+        self.remaining = max(0, requests)
+    
+    def toggle(self, args: List[str]):
+        """REPL /profile: toggles one request, /profile N arms N, /profile off disarms."""
+        if args and args[0].isdigit():
+            self.arm(int(args[0]))
+        elif args == ["off"] or (not args and self.armed):
+            self.arm(0)
+        else:
+            self.arm(1)
+    
+    @contextmanager
+    def capture(self, label: str):
+        if not self.remaining or not self._lock.acquire(blocking=False):
+            yield
+            return
+        
+        try:
+            self.remaining -= 1
+            torch_profile = _start_torch_profiler()
+            python_profile = cProfile.Profile()
+            start = time.perf_counter()
+            python_profile.enable()
+            try:
+                yield
+            finally:
+                python_profile.disable()
+                elapsed = time.perf_counter() - start
+                if torch_profile is not None:
+                    torch_profile.__exit__(None, None, None)
+                    telemetry.annotate = None
+                self._report(label, elapsed, torch_profile, python_profile)
+        finally:
+            self._lock.release()
+    
+    def _report(self, label: str, elapsed: float, torch_profile, python_profile):
+        """Write the trace files and print the hotspots."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stem = self.output_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{label}"
+        python_profile.dump_stats(f"{stem}.pstats")
+        files = [f"{stem}.pstats"]
+        
+        print(f"\n🔬 Profile {label}: {elapsed:.2f}s")
+        if torch_profile is not None:
+            torch_profile.export_chrome_trace(f"{stem}.json")
+            files.insert(0, f"{stem}.json")
+            print("  Top operators (self CPU):")
+            events = sorted(torch_profile.key_averages(),
+                            key=lambda e: e.self_cpu_time_total, reverse=True)
+            for event in events[:self.top]:
+                seconds = event.self_cpu_time_total / 1e6
+                print(f"    {event.key[:48]:<48} {event.count:>7} calls {seconds:8.3f}s "
+                      f"{100 * seconds / elapsed:5.1f}%")
+        
+        print("  Top Python functions (own time, capturing thread only):")
+        stats = pstats.Stats(python_profile).stats
+        for (filename, line, function), (_, calls, own, cumulative, _) in sorted(
+                stats.items(), key=lambda item: item[1][2], reverse=True)[:self.top]:
+            where = f"{Path(filename).name}:{line}({function})"
+            print(f"    {where[:48]:<48} {calls:>7} calls {own:8.3f}s  cum {cumulative:.3f}s")
+        print(f"  Saved {', '.join(files)}")
+        print("  Note: cProfile sees only the thread that ran the request; work in "
+              "job threads or shard/replica processes is missing from the Python profile")
+        if self.remaining:
+            print(f"  {self.remaining} more request(s) will be profiled")
+
+
+def _start_torch_profiler():
+    """CPU operator profiler with telemetry stages as labelled ranges, if torch is present."""
+    try:
+        from torch.profiler import ProfilerActivity, profile, record_function
+    except ImportError:
+        return None
+    
+    torch_profile = profile(activities=[ProfilerActivity.CPU], record_shapes=True)
+    torch_profile.__enter__()
+    telemetry.annotate = _thread_scoped(record_function, threading.get_ident())
+    return torch_profile
+
+
+def _thread_scoped(annotate, thread_id: int):
+    """Label telemetry stages only on the capturing thread, not concurrent jobs."""
+    def scoped(name: str):
+        return annotate(name) if threading.get_ident() == thread_id else nullcontext()
+    return scoped
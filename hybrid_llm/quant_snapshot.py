@@ -0,0 +1,293 @@
+"""
+Quantized Snapshots - Save an already-quantized model once, mmap it on later starts
+Avoids re-quantizing full-precision weights on every load
+"""
+
+import hashlib
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Dict
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import transformers
+from transformers import AutoConfig, AutoModelForCausalLM
+
+from model_manifest import ModelManifest, expected_weight_files
+
+
+SNAPSHOT_FORMAT = 1
+
+# Output channels dequantized at a time when the fused int8 kernel is missing
+_DEQUANT_BLOCK = 1024
+
+_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16,
+    "BF16": torch.bfloat16, "I64": torch.int64, "I32": torch.int32,
+    "I16": torch.int16, "I8": torch.int8, "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+
+def quantize_weight(weight: torch.Tensor):
+    """Symmetric per-output-channel int8: returns (int8 weight, float32 scales)."""
+    weight = weight.detach().float()
+    scale = weight.abs().amax(dim=1).clamp(min=1e-8) / 127
+    return torch.round(weight / scale[:, None]).clamp(-127, 127).to(torch.int8), scale
+
+
+class Int8Linear(nn.Module):
+    """Weight-only int8 linear layer with per-output-channel scales."""
+    
+    def __init__(self, in_features: int, out_features: int, bias: bool = True, device=None):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.register_buffer(
+            "weight_int8", torch.empty(out_features, in_features, dtype=torch.int8, device=device)
+        )
+        self.register_buffer(
+            "weight_scale", torch.empty(out_features, dtype=torch.float32, device=device)
+        )
+        if bias:
+            self.register_buffer("bias", torch.empty(out_features, device=device))
+        else:
+            self.bias = None
+    
+    @classmethod
+    def from_linear(cls, linear: nn.Linear) -> "Int8Linear":
+        layer = cls(linear.in_features, linear.out_features, linear.bias is not None)
+        layer.weight_int8, layer.weight_scale = quantize_weight(linear.weight)
+        if linear.bias is not None:
+            layer.bias = linear.bias.detach().float()
+        return layer
+    
+    def forward(self, x):
+        scale = self.weight_scale.to(x.dtype)
+        out = None
+        if has_int8_matmul():
+            # Fused weight-only int8 GEMM: the weight is never dequantized
+            flat = x.reshape(-1, self.in_features).contiguous()
+            try:
+                out = torch.ops.aten._weight_int8pack_mm(flat, self.weight_int8, scale)
+                out = out.reshape(*x.shape[:-1], self.out_features)
+            except RuntimeError:  # dtype or device the kernel does not cover
+                out = None
+        if out is None:
+            # x @ (s * Q)^T == (x @ Q^T) * s; dequantize a block of rows at a
+            # time so no full-precision copy of the weight is allocated
+            out = torch.cat([
+                F.linear(x, block.to(x.dtype))
+                for block in self.weight_int8.split(_DEQUANT_BLOCK)
+            ], dim=-1) * scale
+        if self.bias is not None:
+            out = out + self.bias.to(x.dtype)
+        return out
+
+
+def has_int8_matmul() -> bool:
+    """True if this torch build has the fused weight-only int8 CPU kernel (torch >= 2.3)."""
+    return hasattr(torch.ops.aten, "_weight_int8pack_mm")
+
+
+def quantize_int8(model: nn.Module, skip=("lm_head",), device=None, from_weights: bool = True):
+    """Replace nn.Linear layers in place (lm_head is skipped to keep weight tying)."""
+    for module in list(model.modules()):
+        for child_name, child in list(module.named_children()):
+            if not isinstance(child, nn.Linear) or child_name in skip:
+                continue
+            if from_weights:
+                replacement = Int8Linear.from_linear(child)
+            else:
+                replacement = Int8Linear(child.in_features, child.out_features,
+                                         child.bias is not None, device=device)
+            setattr(module, child_name, replacement)
+    return model
+
+
+def _int8_skeleton(config):
+    """Model on the meta device with Int8Linear layers, ready for assign=True loading."""
+    from accelerate import init_empty_weights
+    
+    with init_empty_weights():
+        model = AutoModelForCausalLM.from_config(config, trust_remote_code=True,
+                                                 torch_dtype=torch.float32)
+    quantize_int8(model, device="meta", from_weights=False)
+    return model
+
+
+def _finish_assigned(model):
+    """Tie weights and make sure assign=True loading filled every tensor."""
+    model.tie_weights()
+    tensors = list(model.named_parameters()) + list(model.named_buffers())
+    still_meta = [n for n, t in tensors if t.device.type == "meta"]
+    if still_meta:
+        raise RuntimeError(f"Missing tensors: {still_meta[:5]}")
+    return model
+
+
+def load_int8_streaming(model_name: str, manifest: ModelManifest = None):
+    """
+    Build an int8 model straight from the cached safetensors shards.
+
+    Shards are memory-mapped and each Linear weight is quantized as it is
+    read, so peak memory is the int8 model plus one full-precision tensor
+    rather than a full-precision copy of the model. Returns None when the
+    model is not cached as safetensors.
+    """
+    manifest = manifest or ModelManifest()
+    snapshot = manifest.snapshot_dir(model_name)
+    files = expected_weight_files(snapshot) if snapshot else []
+    if not files or not all(name.endswith(".safetensors") for name in files):
+        return None
+    
+    model = _int8_skeleton(AutoConfig.from_pretrained(snapshot, trust_remote_code=True))
+    int8_layers = {name for name, module in model.named_modules() if isinstance(module, Int8Linear)}
+    expected = set(model.state_dict().keys())
+    
+    for name in files:
+        state = {}
+        for key, tensor in mmap_safetensors(snapshot / name).items():
+            layer, _, kind = key.rpartition(".")
+            if layer in int8_layers and kind == "weight":
+                state[f"{layer}.weight_int8"], state[f"{layer}.weight_scale"] = quantize_weight(tensor)
+            elif key in expected:
+                # Embeddings, norms and biases stay full precision, as in "none"
+                state[key] = tensor.float()
+        model.load_state_dict(state, strict=False, assign=True)
+    return _finish_assigned(model)
+
+
+def mmap_safetensors(path: Path) -> Dict[str, torch.Tensor]:
+    """
+    Map a .safetensors file and return tensors that view it without copying.
+
+    The mapping is copy-on-write, so pages are shared with the page cache
+    until something writes to them.
+    """
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    
+    data_start = 8 + header_len
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = _DTYPES[info["dtype"]]
+        begin, end = info["data_offsets"]
+        count = (end - begin) // torch.tensor([], dtype=dtype).element_size()
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        tensors[name] = torch.frombuffer(
+            mapped, dtype=dtype, count=count, offset=data_start + begin
+        ).view(info["shape"])
+    return tensors
+
+
+class SnapshotStore:
+    """Quantized model snapshots keyed by source model and quantization mode."""
+    
+    def __init__(self, root: str = "models/snapshots", manifest: ModelManifest = None):
+        self.root = Path(root)
+        self.manifest = manifest or ModelManifest()
+    
+    def path_for(self, model_name: str, quantization: str) -> Path:
+        return self.root / f"{model_name.replace('/', '--')}--{quantization}"
+    
+    def fingerprint(self, model_name: str, quantization: str, quant_config: Dict) -> str:
+        """Hash of the source weights, quantization settings and library versions."""
+        entry = self.manifest.check(model_name, verify_hashes=False)
+        source = {
+            "revision": entry.get("revision"),
+            "files": {name: [f["blob"], f["size"]] for name, f in entry["files"].items()},
+        }
+        payload = {
+            "format": SNAPSHOT_FORMAT,
+            "model": model_name,
+            "quantization": quantization,
+            "quant_config": quant_config,
+            "source": source,
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    
+    def is_valid(self, model_name: str, quantization: str, quant_config: Dict) -> bool:
+        info_path = self.path_for(model_name, quantization) / "fingerprint.json"
+        if not info_path.exists():
+            return False
+        with open(info_path) as f:
+            stored = json.load(f).get("fingerprint")
+        return stored == self.fingerprint(model_name, quantization, quant_config)
+    
+    def save(self, model, model_name: str, quantization: str, quant_config: Dict):
+        """Write a loaded, quantized model to its snapshot directory."""
+        from safetensors.torch import save_file
+        
+        path = self.path_for(model_name, quantization)
+        path.mkdir(parents=True, exist_ok=True)
+        
+        if quantization == "int8":
+            model.config.save_pretrained(path)
+            state, seen, tied = {}, set(), []
+            for key, tensor in model.state_dict().items():
+                ptr = tensor.data_ptr()
+                if tensor.numel() and ptr in seen:
+                    tied.append(key)  # shared with an earlier tensor
+                    continue
+                seen.add(ptr)
+                state[key] = tensor.contiguous()
+            save_file(state, str(path / "model.safetensors"),
+                      metadata={"tied": json.dumps(tied)})
+        else:
+            # bitsandbytes 4/8-bit weights serialize with their quant state
+            model.save_pretrained(path, safe_serialization=True)
+        
+        with open(path / "fingerprint.json", "w") as f:
+            json.dump({
+                "fingerprint": self.fingerprint(model_name, quantization, quant_config),
+                "model": model_name,
+                "quantization": quantization,
+            }, f, indent=2)
+    
+    def load(self, model_name: str, quantization: str):
+        """Load a snapshot without re-quantizing."""
+        path = self.path_for(model_name, quantization)
+        
+        if quantization != "int8":
+            return AutoModelForCausalLM.from_pretrained(
+                path,
+                device_map="auto",
+                low_cpu_mem_usage=True,
+                trust_remote_code=True,
+            )
+        
+        model = _int8_skeleton(AutoConfig.from_pretrained(path, trust_remote_code=True))
+        state = mmap_safetensors(path / "model.safetensors")
+        missing, unexpected = model.load_state_dict(state, strict=False, assign=True)
+        if unexpected:
+            raise RuntimeError(f"Unexpected tensors in snapshot: {unexpected[:5]}")
+        return _finish_assigned(model)
+
+
+def main():
+    """List snapshots and whether they still match their source model."""
+    store = SnapshotStore()
+    if not store.root.exists():
+        print(f"No snapshots in {store.root}")
+        return
+    
+    for info_path in sorted(store.root.glob("*/fingerprint.json")):
+        with open(info_path) as f:
+            info = json.load(f)
+        size = sum(p.stat().st_size for p in info_path.parent.iterdir()) / 1024 ** 3
+        print(f"{info['model']:<40} {info['quantization']:<6} {size:6.2f} GB")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,66 +3,99 @@ RAG-Enhanced Qwen Coder
 Can reference local code/docs to create novel combinations
 """
 
-import os
-import json
-from pathlib import Path
-from typing import List, Dict
+from typing import Dict, List, Optional
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
-
-
-class CodebaseRAG:
-    """Simple RAG system for local code reference."""
-    
-    def __init__(self, codebase_path: str = "."):
-        self.codebase_path = Path(codebase_path)
-        self.code_index = {}
-        self._index_codebase()
-    
-    def _index_codebase(self):
-        """Index all code files for quick retrieval."""
-        extensions = {'.py', '.js', '.ts', '.java', '.cpp', '.c', '.go', '.rs'}
-        
-        for ext in extensions:
-            for file_path in self.codebase_path.rglob(f'*{ext}'):
-                if 'venv' in str(file_path) or 'node_modules' in str(file_path):
-                    continue
-                
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        self.code_index[str(file_path)] = {
-                            'content': content,
-                            'language': ext[1:],
-                            'size': len(content)
-                        }
-                except:
-                    pass
-        
-        print(f"Indexed {len(self.code_index)} code files")
-    
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Simple keyword-based search (can be upgraded to embeddings)."""
-        results = []
-        query_lower = query.lower()
-        
-        for path, data in self.code_index.items():
-            content_lower = data['content'].lower()
-            
-            # Count keyword matches
-            score = sum(content_lower.count(word) for word in query_lower.split())
-            
-            if score > 0:
-                results.append({
-                    'path': path,
-                    'score': score,
-                    'content': data['content'][:1000],  # First 1000 chars
-                    'language': data['language']
-                })
-        
-        # Sort by score and return top_k
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:top_k]
+from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig, StoppingCriteriaList
+from telemetry import telemetry, GenerationTimer, current_rss_mb
+from quant_snapshot import SnapshotStore, load_int8_streaming, quantize_int8
+from context_compressor import ContextCompressor
+from codebase_rag import CodebaseRAG
+from kv_cache import KVCachePolicy, describe as describe_kv
+from profiler import RequestProfiler
+
+
+# Draft-model-free speculation: continuations are copied from matching n-grams
+# in the prompt and verified in one forward pass (transformers prompt lookup)
+DEFAULT_PROMPT_LOOKUP = {
+    "enabled": False,
+    "draft_tokens": 10,   # tokens proposed per step
+    "max_ngram": None,    # longest n-gram matched against the prompt (None = library default)
+}
+
+
+def quantization_kwargs(quantization: str) -> Dict:
+    """from_pretrained arguments for a quantization mode ("4bit", "8bit", "int8", "none")."""
+    if quantization == "4bit":
+        return {
+            "quantization_config": BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=torch.float16,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_use_double_quant=True,
+            ),
+            "device_map": "auto",
+        }
+    if quantization == "8bit":
+        return {
+            "quantization_config": BitsAndBytesConfig(load_in_8bit=True),
+            "device_map": "auto",
+        }
+    if quantization == "int8":
+        # Fallback when the weights cannot be streamed: load at half the fp32
+        # footprint, then quantize (weight-only, CPU)
+        return {"torch_dtype": torch.bfloat16, "device_map": "cpu"}
+    if quantization == "none":
+        return {"torch_dtype": torch.float32, "device_map": "cpu"}
+    raise ValueError(f"Unknown quantization mode: {quantization}")
+
+
+def quantization_descriptor(quantization: str) -> Dict:
+    """Serializable description of a quantization mode, for snapshot fingerprints."""
+    kwargs = quantization_kwargs(quantization)
+    config = kwargs.get("quantization_config")
+    described = config.to_dict() if config is not None else {}
+    described["mode"] = quantization
+    described["dtype"] = str(kwargs.get("torch_dtype"))
+    return described
+
+
+def load_model(model_name: str, quantization: str = "4bit", snapshot_dir: str = None):
+    """
+    Load a model at the given quantization.
+    
+    With snapshot_dir set, the first load saves the quantized weights and
+    later loads map that snapshot instead of quantizing again. A snapshot
+    is used only while its fingerprint matches the source model and
+    quantization settings.
+    """
+    store = SnapshotStore(snapshot_dir) if snapshot_dir and quantization != "none" else None
+    descriptor = quantization_descriptor(quantization)
+    
+    if store and store.is_valid(model_name, quantization, descriptor):
+        print(f"Loading {quantization} snapshot from {store.path_for(model_name, quantization)}")
+        return store.load(model_name, quantization)
+    
+    model = load_int8_streaming(model_name) if quantization == "int8" else None
+    if model is None:
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            trust_remote_code=True,
+            low_cpu_mem_usage=True,
+            **quantization_kwargs(quantization)
+        )
+        if quantization == "int8":
+            print("⚠️  Weights not cached as safetensors; int8 load peaks at ~2 bytes/param")
+            # Linear layers are replaced one at a time; the rest returns to fp32
+            quantize_int8(model).float()
+    
+    if store:
+        print("Saving quantized snapshot for faster startup...")
+        try:
+            store.save(model, model_name, quantization, descriptor)
+        except Exception as e:
+            print(f"Could not save snapshot: {e}")
+    
+    return model
 
 
 class RAGQwenCoder:
@@ -71,34 +104,47 @@ class RAGQwenCoder:
     def __init__(
         self,
         model_name: str = "Qwen/Qwen2.5-Coder-7B-Instruct",
-        codebase_path: str = "."
+        codebase_path: str = ".",
+        docs_index_path: str = ".rag_cache/docs_index.json",
+        quantization: str = "4bit",
+        snapshot_dir: str = None,
+        compression: Dict = None,
+        rag: CodebaseRAG = None,
+        kv_cache: Dict = None,
+        model=None,
+        index_path: str = None,
+        prompt_lookup: Dict = None
     ):
         print("Initializing RAG-Enhanced Qwen Coder...")
+        self.model_name = model_name
         
-        # Initialize RAG
-        self.rag = CodebaseRAG(codebase_path)
-        
-        # Load model with 4-bit quantization
-        quantization_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_compute_dtype=torch.float16,
-            bnb_4bit_quant_type="nf4",
-            bnb_4bit_use_double_quant=True,
-        )
+        # Initialize RAG (or use a prebuilt one, e.g. a ShardedRAG)
+        self.rag = rag or CodebaseRAG(codebase_path, docs_index_path=docs_index_path,
+                                      index_path=index_path)
         
         self.tokenizer = AutoTokenizer.from_pretrained(
             model_name,
             trust_remote_code=True
         )
         
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            quantization_config=quantization_config,
-            device_map="auto",
-            trust_remote_code=True,
-            low_cpu_mem_usage=True,
+        # Shrinks retrieved snippets before they reach the prompt
+        self.compressor = ContextCompressor(
+            compression,
+            count_tokens=lambda text: len(self.tokenizer.encode(text))
         )
         
+        # KV cache strategy per request (quantized / sliding window with sinks)
+        self.kv_policy = KVCachePolicy(kv_cache)
+        self.prompt_lookup = dict(DEFAULT_PROMPT_LOOKUP, **(prompt_lookup or {}))
+        
+        if model is not None:
+            # Already loaded, e.g. the shared copy behind a ReplicaPool
+            self.model = model
+        else:
+            with telemetry.timer('model.load'):
+                self.model = load_model(model_name, quantization, snapshot_dir)
+        telemetry.record_memory()
+        
         self.model.eval()
         print("Ready!")
     
@@ -106,7 +152,8 @@ class RAGQwenCoder:
         self,
         task: str,
         use_rag: bool = True,
-        temperature: float = 0.3  # Higher for creativity
+        temperature: float = 0.3,  # Higher for creativity
+        stopping_criteria: Optional[List] = None
     ) -> str:
         """
         Generate novel code by combining patterns from codebase.
@@ -115,17 +162,188 @@ class RAGQwenCoder:
             task: What to build
             use_rag: Whether to search codebase for reference
             temperature: Higher = more creative combinations
+            stopping_criteria: Extra criteria, e.g. a job's CancelCriterion
+        """
+        with telemetry.timer('prompt.build'):
+            text = self._build_prompt(task, use_rag)
+        
+        with telemetry.timer('tokenize'):
+            inputs = self.tokenizer(text, return_tensors="pt").to(self.model.device)
+        
+        max_new_tokens = 2048
+        cache_kwargs, kv_estimate = self.kv_policy.generate_kwargs(
+            self.model, inputs.input_ids.shape[1], max_new_tokens
+        )
+        lookup_kwargs = self._prompt_lookup_kwargs(kv_estimate)
+        rss_before = self._start_memory_report()
+        
+        gen_timer = GenerationTimer(telemetry, inputs.input_ids.shape[1],
+                                    input_width=inputs.input_ids.shape[1])
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                top_p=0.95,
+                top_k=50,
+                repetition_penalty=1.1,
+                do_sample=True,
+                pad_token_id=self.tokenizer.eos_token_id,
+                stopping_criteria=StoppingCriteriaList([gen_timer, *(stopping_criteria or [])]),
+                **cache_kwargs,
+                **lookup_kwargs
+            )
+        gen_timer.finish()
+        self._finish_memory_report(kv_estimate, rss_before)
+        if lookup_kwargs:
+            self._report_prompt_lookup(gen_timer)
+        
+        response = self.tokenizer.decode(
+            outputs[0][inputs.input_ids.shape[1]:],
+            skip_special_tokens=True
+        )
+        
+        return response.strip()
+    
+    def generate_batch(
+        self,
+        prompts: List[str],
+        max_new_tokens: int = 2048,
+        temperature: float = 0.3
+    ) -> List[Dict]:
+        """
+        Generate for several chat-formatted prompts in one left-padded batch.
+        
+        Returns one dict per prompt with the response and its token counts
+        (completion tokens stop at the first EOS).
+        """
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        
+        with telemetry.timer('tokenize'):
+            inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+        width = inputs.input_ids.shape[1]
+        
+        sampling = {"do_sample": False}
+        if temperature > 0:
+            sampling = {"do_sample": True, "temperature": temperature, "top_p": 0.95, "top_k": 50}
+        
+        cache_kwargs, kv_estimate = self.kv_policy.generate_kwargs(
+            self.model, width, max_new_tokens, batch_size=len(prompts)
+        )
+        rss_before = self._start_memory_report()
+        
+        gen_timer = GenerationTimer(
+            telemetry, int(inputs.attention_mask.sum()), prefix='batch.generate',
+            batch_size=len(prompts)
+        )
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                repetition_penalty=1.1,
+                pad_token_id=self.tokenizer.pad_token_id,
+                stopping_criteria=StoppingCriteriaList([gen_timer]),
+                **sampling,
+                **cache_kwargs
+            )
+        gen_timer.finish()
+        self._finish_memory_report(kv_estimate, rss_before)
+        
+        results = []
+        for row, mask in zip(outputs, inputs.attention_mask):
+            generated = row[width:]
+            eos = (generated == self.tokenizer.eos_token_id).nonzero()
+            length = int(eos[0]) + 1 if len(eos) else len(generated)
+            results.append({
+                "response": self.tokenizer.decode(generated[:length], skip_special_tokens=True).strip(),
+                "prompt_tokens": int(mask.sum()),
+                "completion_tokens": length,
+            })
+        return results
+    
+    def _prompt_lookup_kwargs(self, kv_estimate: Dict) -> Dict:
+        """generate() arguments for prompt lookup decoding, if enabled for this request."""
+        if not self.prompt_lookup["enabled"]:
+            return {}
+        if kv_estimate["strategy"] != "dynamic":
+            # Rejected drafts are rolled back by cropping the cache, which
+            # quantized and sink caches cannot do
+            print(f"⚠️  Prompt lookup skipped: the {kv_estimate['strategy']} KV cache "
+                  f"cannot roll back rejected drafts")
+            return {}
+        
+        kwargs = {"prompt_lookup_num_tokens": self.prompt_lookup["draft_tokens"]}
+        if self.prompt_lookup["max_ngram"]:
+            kwargs["max_matching_ngram_size"] = self.prompt_lookup["max_ngram"]
+        return kwargs
+    
+    def _report_prompt_lookup(self, gen_timer: GenerationTimer):
+        """
+        Print and record how much speculation paid off.
+        
+        Every verification step yields one token from the model plus the
+        accepted draft tokens. Steps without an n-gram match propose fewer
+        (or no) tokens and generate() does not expose how many were drafted,
+        so tokens per forward pass is reported rather than an acceptance rate.
         """
+        steps, tokens = gen_timer.steps, gen_timer.new_tokens
+        if not steps:
+            return
+        accepted = max(0, tokens - steps)
+        telemetry.observe('generate.lookup_tokens_per_step', tokens / steps)
+        telemetry.incr('generate.lookup_accepted', accepted)
+        print(f"⚡ Prompt lookup: {tokens} tokens in {steps} forward passes "
+              f"({tokens / steps:.2f} tokens/pass, {accepted} from accepted drafts)")
+    
+    def _start_memory_report(self):
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        return current_rss_mb()
+    
+    def _finish_memory_report(self, kv_estimate: Dict, rss_before: float):
+        """Print and record this request's KV cache estimate and memory growth."""
+        telemetry.observe('generate.kv_cache_mb', kv_estimate['kv_mb'])
+        line = f"🧠 {describe_kv(kv_estimate)}"
+        
+        rss_after = current_rss_mb()
+        if rss_before is not None and rss_after is not None:
+            telemetry.observe('generate.rss_growth_mb', rss_after - rss_before)
+            line += f", RSS {rss_after:.0f} MB ({rss_after - rss_before:+.0f})"
+        if torch.cuda.is_available():
+            peak = torch.cuda.max_memory_allocated() / 1024 ** 2
+            telemetry.observe('generate.cuda_peak_mb', peak)
+            line += f", CUDA peak {peak:.0f} MB"
+        print(line)
+    
+    def _build_prompt(self, task: str, use_rag: bool) -> str:
+        """Assemble the chat-formatted prompt with retrieved context."""
         context = ""
         
         if use_rag:
             # Search for relevant code patterns
             results = self.rag.search(task, top_k=3)
             
+            if results and self.compressor.enabled:
+                savings = self.compressor.compress_results(results, task)
+                telemetry.incr('prompt.context_tokens_saved', savings['saved_tokens'])
+                if savings['raw_tokens']:
+                    pct = 100 * savings['saved_tokens'] / savings['raw_tokens']
+                    print(f"📉 Context compressed: {savings['raw_tokens']} → "
+                          f"{savings['compressed_tokens']} tokens (-{pct:.0f}%)")
+            
             if results:
                 context = "\n\n## Reference Code Patterns:\n"
                 for i, result in enumerate(results, 1):
-                    context += f"\n### Pattern {i} ({result['language']}):\n"
+                    if 'source_url' in result:
+                        context += f"\n### Pattern {i} (docs: {result['source_url']}):\n"
+                    elif 'shard' in result:
+                        context += f"\n### Pattern {i} ({result['language']}, {result['shard']}):\n"
+                    elif 'symbol' in result:
+                        context += f"\n### Pattern {i} ({result['symbol']}, {result['relation']}):\n"
+                    else:
+                        context += f"\n### Pattern {i} ({result['language']}):\n"
                     context += f"```{result['language']}\n{result['content']}\n```\n"
         
         # Build prompt
@@ -150,32 +368,11 @@ Think step-by-step about how to merge these concepts."""
             {"role": "user", "content": user_prompt}
         ]
         
-        text = self.tokenizer.apply_chat_template(
+        return self.tokenizer.apply_chat_template(
             messages,
             tokenize=False,
             add_generation_prompt=True
         )
-        
-        inputs = self.tokenizer(text, return_tensors="pt").to(self.model.device)
-        
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=2048,
-                temperature=temperature,
-                top_p=0.95,
-                top_k=50,
-                repetition_penalty=1.1,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id,
-            )
-        
-        response = self.tokenizer.decode(
-            outputs[0][inputs.input_ids.shape[1]:],
-            skip_special_tokens=True
-        )
-        
-        return response.strip()
 
 
 def main():
@@ -196,6 +393,7 @@ def main():
         model_name="Qwen/Qwen2.5-Coder-7B-Instruct",
         codebase_path="."  # Change to your project path
     )
+    profiler = RequestProfiler()
     
     while True:
         try:
@@ -208,15 +406,24 @@ def main():
             if not task:
                 continue
             
+            if task.startswith('/profile'):
+                profiler.toggle(task.split()[1:])
+                if profiler.armed:
+                    print(f"🔬 Profiling the next {profiler.remaining} request(s)")
+                else:
+                    print("Profiling off")
+                continue
+            
             print("\n🔍 Searching codebase for relevant patterns...")
             print("🧠 Combining concepts to create novel solution...")
             print("\n" + "-" * 70)
             
-            result = coder.generate_novel_code(task, use_rag=True, temperature=0.4)
+            with profiler.capture("request"):
+                result = coder.generate_novel_code(task, use_rag=True, temperature=0.4)
             
             print(result)
             print("-" * 70)
-            
+        
         except KeyboardInterrupt:
             break
         except Exception as e:
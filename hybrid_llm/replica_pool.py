@@ -0,0 +1,335 @@
+"""
+Replica Pool - Several inference processes sharing one copy of the weights
+The model is loaded once, then N workers are forked that map the same pages
+(or get shared-memory handles under spawn); requests go to whichever worker is idle
+"""
+
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import nullcontext
+from typing import Dict, Optional
+
+import torch
+import torch.multiprocessing as mp
+from transformers import StoppingCriteriaList
+
+from job_queue import CancelCriterion
+from kv_cache import KVCachePolicy
+from network_monitor import offline_mode
+from telemetry import telemetry
+
+
+# bitsandbytes 4/8-bit weights live on the GPU and cannot be shared this way
+SHAREABLE_QUANT_MODES = ("int8", "none")
+
+# Recently cancelled job ids, shared with the workers
+CANCEL_RING_SIZE = 64
+
+# How often the collector checks for workers that died mid-request
+LIVENESS_INTERVAL_S = 1.0
+
+
+def start_method() -> str:
+    """fork shares the parent's mappings without pickling the model; spawn (Windows) passes handles."""
+    return "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+
+
+def load_shared_model(model_name: str, quantization: str, snapshot_dir: str = None):
+    """
+    Load a CPU model that replica workers can share.
+
+    Under fork the workers inherit the parent's pages as they are, so nothing
+    is copied (an int8 snapshot stays mmapped from the page cache). The load
+    runs single-threaded so no OpenMP pool exists when the workers are forked;
+    create the ReplicaPool before running anything else on torch. Under spawn
+    every tensor is moved to shared memory for the workers to map.
+    """
+    if quantization not in SHAREABLE_QUANT_MODES:
+        raise ValueError(
+            f"Replica pool needs a CPU quantization mode {SHAREABLE_QUANT_MODES}, got {quantization!r}"
+        )
+    
+    from rag_coder import load_model
+    
+    forking = start_method() == "fork"
+    threads = torch.get_num_threads()
+    if forking:
+        # Forking after an OpenMP parallel region can hang the children
+        torch.set_num_threads(1)
+    try:
+        with telemetry.timer('model.load'):
+            model = load_model(model_name, quantization, snapshot_dir)
+            model.eval()
+            if not forking:
+                model.share_memory()
+    finally:
+        # Only sets the size; the pool itself starts at the next parallel op
+        torch.set_num_threads(threads)
+    size = sum(t.numel() * t.element_size()
+               for t in itertools.chain(model.parameters(), model.buffers()))
+    telemetry.gauge('pool.shared_weights_mb', size / 1024 ** 2)
+    print(f"Shared weights: {size / 1024 ** 3:.2f} GB (mapped once for all workers)")
+    return model
+
+
+class _JobCancelled:
+    """Event-like view of one job id in the shared cancel ring."""
+    
+    def __init__(self, job_id: int, ring):
+        self.job_id = job_id
+        self.ring = ring
+    
+    def is_set(self) -> bool:
+        return self.job_id in self.ring[:]
+
+
+def _worker_main(worker_id: int, model, tokenizer, tasks, results, cancelled, threads: int,
+                 kv_cache: Optional[Dict], offline: bool):
+    """Worker process: run the requests assigned to it until a None sentinel arrives."""
+    torch.set_num_threads(threads)
+    kv_policy = KVCachePolicy(kv_cache)
+    
+    with offline_mode() if offline else nullcontext():
+        while True:
+            job = tasks.get()
+            if job is None:
+                break
+            
+            start = time.perf_counter()
+            cancel = _JobCancelled(job["id"], cancelled)
+            if cancel.is_set():
+                results.put({"id": job["id"], "worker": worker_id, "seconds": 0.0, "cancelled": True,
+                             "response": "", "prompt_tokens": 0, "completion_tokens": 0})
+                continue
+            
+            try:
+                inputs = tokenizer(job["prompt"], return_tensors="pt")
+                prompt_tokens = inputs.input_ids.shape[1]
+                cache_kwargs, _ = kv_policy.generate_kwargs(model, prompt_tokens,
+                                                            job["max_new_tokens"])
+                sampling = {"do_sample": False}
+                if job["temperature"] > 0:
+                    sampling = {"do_sample": True, "temperature": job["temperature"],
+                                "top_p": 0.95, "top_k": 50}
+                with torch.no_grad():
+                    outputs = model.generate(
+                        **inputs,
+                        max_new_tokens=job["max_new_tokens"],
+                        repetition_penalty=1.1,
+                        pad_token_id=tokenizer.eos_token_id,
+                        stopping_criteria=StoppingCriteriaList([CancelCriterion(cancel)]),
+                        **sampling,
+                        **cache_kwargs
+                    )
+                generated = outputs[0][prompt_tokens:]
+                result = {
+                    "response": tokenizer.decode(generated, skip_special_tokens=True).strip(),
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(generated),
+                    "cancelled": cancel.is_set(),
+                }
+            except Exception as e:
+                result = {"error": str(e), "prompt_tokens": 0, "completion_tokens": 0}
+            
+            result.update(id=job["id"], worker=worker_id, seconds=time.perf_counter() - start)
+            results.put(result)
+
+
+class ReplicaPool:
+    """
+    N forked inference workers over one shared model.
+
+    submit() returns a concurrent.futures.Future resolved with the worker's
+    result dict (response, token counts, seconds, worker id).
+    """
+    
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        model_name: str,
+        replicas: int = 2,
+        threads_per_replica: Optional[int] = None,
+        kv_cache: Optional[Dict] = None,
+        offline: bool = False
+    ):
+        self.model = model
+        # Not model.config._name_or_path: for a snapshot that is the snapshot directory
+        self.model_name = model_name
+        self.replicas = replicas
+        threads = threads_per_replica or max(1, (os.cpu_count() or 1) // replicas)
+        
+        method = start_method()
+        context = mp.get_context(method)
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        
+        # One inbox per worker: the parent assigns each request to an idle
+        # worker, so it always knows which request a dead worker was holding
+        self.inboxes = [context.Queue() for _ in range(replicas)]
+        self.results = context.Queue()
+        self._cancelled = context.Array('q', [-1] * CANCEL_RING_SIZE, lock=False)
+        self._cancel_slot = 0
+        self.workers = [
+            context.Process(
+                target=_worker_main,
+                args=(i, model, tokenizer, self.inboxes[i], self.results, self._cancelled,
+                      threads, kv_cache, offline),
+                daemon=True,
+            )
+            for i in range(replicas)
+        ]
+        for worker in self.workers:
+            worker.start()
+        
+        self._ids = itertools.count()
+        self._pending = {}
+        self._backlog = deque()  # requests not yet assigned to a worker
+        self._assigned = {}      # worker id -> id of the request it holds
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stats = [{"requests": 0, "tokens": 0, "busy_s": 0.0, "errors": 0}
+                      for _ in range(replicas)]
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        print(f"Started {replicas} replica workers ({method}, {threads} threads each)")
+    
+    def submit(self, prompt: str, max_new_tokens: int = 2048, temperature: float = 0.3) -> Future:
+        """Queue a chat-formatted prompt; the next idle worker picks it up."""
+        future = Future()
+        with self._lock:
+            job_id = next(self._ids)
+            self._pending[job_id] = future
+            self._backlog.append({"id": job_id, "prompt": prompt,
+                                  "max_new_tokens": max_new_tokens, "temperature": temperature})
+        future.job_id = job_id
+        self._dispatch()
+        return future
+    
+    def _dispatch(self):
+        """Hand backlog requests to live workers that hold none."""
+        with self._lock:
+            for i, worker in enumerate(self.workers):
+                if not self._backlog:
+                    break
+                if i not in self._assigned and worker.is_alive():
+                    job = self._backlog.popleft()
+                    self._assigned[i] = job["id"]
+                    self.inboxes[i].put(job)
+    
+    def cancel(self, future: Future):
+        """Stop a submitted request; its worker ends generation at the next token."""
+        with self._lock:
+            self._cancelled[self._cancel_slot % CANCEL_RING_SIZE] = future.job_id
+            self._cancel_slot += 1
+    
+    def generate(self, prompt: str, max_new_tokens: int = 2048, temperature: float = 0.3,
+                 cancel: Optional[threading.Event] = None) -> str:
+        """Blocking generate; setting cancel stops the request early."""
+        future = self.submit(prompt, max_new_tokens, temperature)
+        while cancel is not None and not future.done():
+            if cancel.wait(0.1):
+                self.cancel(future)
+                break
+        result = future.result()
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        return result["response"]
+    
+    def _collect(self):
+        while True:
+            if time.monotonic() - self._checked >= LIVENESS_INTERVAL_S:
+                self._fail_dead_workers()
+            try:
+                result = self.results.get(timeout=LIVENESS_INTERVAL_S)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            if result is None:
+                return
+            with self._lock:
+                self._assigned.pop(result["worker"], None)
+            self._dispatch()
+            
+            stats = self.stats[result["worker"]]
+            stats["requests"] += 1
+            stats["tokens"] += result["completion_tokens"]
+            stats["busy_s"] += result["seconds"]
+            stats["errors"] += "error" in result
+            telemetry.observe('pool.request_s', result["seconds"])
+            telemetry.incr('pool.tokens_out', result["completion_tokens"])
+            
+            with self._lock:
+                future = self._pending.pop(result["id"], None)
+            if future is not None:
+                future.set_result(result)
+    
+    def _fail_dead_workers(self):
+        """Resolve requests held by workers that exited, and the backlog once none are left."""
+        self._checked = time.monotonic()
+        with self._lock:
+            dead = [i for i, worker in enumerate(self.workers)
+                    if not worker.is_alive() and i in self._assigned]
+            failed = [(self._assigned.pop(i), f"worker {i} exited during the request")
+                      for i in dead]
+            if not any(worker.is_alive() for worker in self.workers):
+                failed += [(job["id"], "no replica workers are running") for job in self._backlog]
+                self._backlog.clear()
+        for i in dead:
+            self.stats[i]["errors"] += 1
+        
+        for job_id, error in failed:
+            with self._lock:
+                future = self._pending.pop(job_id, None)
+            if future is not None:
+                telemetry.incr('pool.worker_lost')
+                future.set_result({"id": job_id, "error": error, "response": "",
+                                   "prompt_tokens": 0, "completion_tokens": 0})
+    
+    def report(self) -> Dict:
+        """Aggregate throughput and per-worker utilization since start."""
+        wall = time.perf_counter() - self.started
+        tokens = sum(s["tokens"] for s in self.stats)
+        workers = [
+            dict(s, worker=i, alive=self.workers[i].is_alive(),
+                 utilization=s["busy_s"] / wall if wall else 0.0)
+            for i, s in enumerate(self.stats)
+        ]
+        for w in workers:
+            telemetry.gauge(f"pool.worker{w['worker']}.utilization", w["utilization"])
+        return {
+            "wall_s": wall,
+            "requests": sum(s["requests"] for s in self.stats),
+            "tokens": tokens,
+            "tokens_per_s": tokens / wall if wall else 0.0,
+            "queued": len(self._pending),
+            "workers": workers,
+        }
+    
+    def summary(self) -> str:
+        report = self.report()
+        lines = [
+            f"{report['requests']} requests, {report['tokens']} tokens in {report['wall_s']:.0f}s "
+            f"({report['tokens_per_s']:.1f} tokens/sec aggregate, {report['queued']} in flight)"
+        ]
+        for w in report["workers"]:
+            state = "up" if w["alive"] else "DOWN"
+            lines.append(f"  worker {w['worker']} [{state}] {w['requests']:>5} requests "
+                         f"{w['tokens']:>8} tokens  {100 * w['utilization']:5.1f}% busy")
+        return "\n".join(lines)
+    
+    def close(self):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self.results.put(None)
+
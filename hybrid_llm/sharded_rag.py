@@ -0,0 +1,208 @@
+"""
+Sharded RAG - Retrieval across several codebases at once
+Each root is an independent shard with its own persistent index, served by
+its own worker process; queries fan out in parallel and merge globally
+"""
+
+import hashlib
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from codebase_rag import CodebaseRAG, normalize_scores
+from telemetry import telemetry
+from trigram_index import TrigramIndex
+
+
+# Shard indexes held by this worker process, by shard name
+_worker_shards = {}
+
+
+def _open_shard(name: str, root: str, index_path: str) -> Dict:
+    """Worker side: (re)index a shard and keep it in memory."""
+    rag = CodebaseRAG(root, docs_index_path=None, index_path=index_path, verbose=False)
+    _worker_shards[name] = rag
+    return {"files": len(rag.code_index), "symbols": len(rag.symbols)}
+
+
+def _search_shard(name: str, query: str, top_k: int) -> List[Dict]:
+    """Worker side: search one shard and normalize its scores to [0, 2]."""
+    rag = _worker_shards.get(name)
+    if rag is None:
+        return []
+    
+    results = rag.search(query, top_k=top_k, include_docs=False)
+    finite = [r["score"] for r in results if r["score"] != float("inf")]
+    best = max(finite, default=1)
+    for result in results:
+        if result["score"] == float("inf"):
+            # Exact symbol hits outrank any keyword match
+            result["score"] = 2.0 if result.get("relation") == "definition" else 1.5
+        else:
+            result["score"] = result["score"] / best
+        result["shard"] = name
+    return results
+
+
+def _grep_shard(name: str, pattern: str, literal: bool, ignore_case: bool,
+                max_results: int, context_lines: int) -> List[Dict]:
+    """Worker side: trigram-narrowed grep over one shard."""
+    rag = _worker_shards.get(name)
+    if rag is None:
+        return []
+    
+    results = rag.grep(pattern, literal=literal, ignore_case=ignore_case,
+                       max_results=max_results, context_lines=context_lines)
+    for result in results:
+        result["shard"] = name
+    return results
+
+
+def _shard_name(root: str) -> str:
+    """Basename plus a short hash of the absolute path, so /a/src and /b/src stay apart."""
+    resolved = Path(root).resolve()
+    digest = hashlib.sha1(str(resolved).encode()).hexdigest()[:8]
+    return re.sub(r"[^\w.-]", "_", resolved.name or "root") + "-" + digest
+
+
+class ShardedRAG(CodebaseRAG):
+    """
+    CodebaseRAG over several roots.
+
+    Each shard is pinned to one worker process so its index is loaded
+    exactly once, and the parent process never holds the code itself.
+    The docs partition stays in the parent, as in CodebaseRAG.
+    """
+    
+    def __init__(
+        self,
+        roots: List,
+        docs_index_path: str = ".rag_cache/docs_index.json",
+        index_dir: str = ".rag_cache/shards",
+        workers: Optional[int] = None
+    ):
+        self.index_dir = Path(index_dir)
+        self.shards = {}
+        for root in roots:
+            spec = {"path": root} if isinstance(root, str) else dict(root)
+            name = spec.get("name") or _shard_name(spec["path"])
+            if name in self.shards:
+                raise ValueError(f"Duplicate shard name {name!r} for {spec['path']}")
+            self.shards[name] = {
+                "name": name,
+                "path": spec["path"],
+                "enabled": spec.get("enabled", True),
+                "index_path": str(self.index_dir / f"{name}.json"),
+                "files": 0,
+                "symbols": 0,
+            }
+        
+        # Spawned workers never inherit model or CUDA state from this process
+        workers = max(1, min(workers or os.cpu_count() or 1, len(self.shards)))
+        context = multiprocessing.get_context("spawn")
+        self._executors = [
+            ProcessPoolExecutor(max_workers=1, mp_context=context) for _ in range(workers)
+        ]
+        for i, shard in enumerate(self.shards.values()):
+            shard["executor"] = self._executors[i % workers]
+        
+        # The parent's own code, symbol and trigram indexes stay empty, so
+        # inherited lookups are well-defined and find nothing locally
+        super().__init__(codebase_path=".", docs_index_path=docs_index_path, index_path=None)
+    
+    def _index_codebase(self):
+        """Open every enabled shard in parallel."""
+        self.trigrams = TrigramIndex()
+        with telemetry.timer('rag.index'):
+            self.refresh()
+    
+    def refresh(self, name: str = None):
+        """
+        Re-index one shard (or every enabled shard).
+
+        Only files changed since the shard's last index are read again.
+        """
+        names = [name] if name else [n for n, s in self.shards.items() if s["enabled"]]
+        pending = {}
+        for shard_name in names:
+            shard = self.shards[shard_name]
+            pending[shard_name] = shard["executor"].submit(
+                _open_shard, shard_name, shard["path"], shard["index_path"]
+            )
+        
+        for shard_name, future in pending.items():
+            shard = self.shards[shard_name]
+            try:
+                shard.update(future.result())
+                print(f"Indexed shard {shard_name}: {shard['files']} code files "
+                      f"({shard['symbols']} symbols)")
+            except Exception as e:
+                shard["enabled"] = False
+                print(f"⚠️  Shard {shard_name} failed to index and was disabled: {e}")
+        telemetry.gauge('rag.files_indexed', sum(s["files"] for s in self.shards.values()))
+    
+    def enable(self, name: str):
+        """Enable a shard, indexing it if it has not been opened yet."""
+        shard = self.shards[name]
+        shard["enabled"] = True
+        if not shard["files"]:
+            self.refresh(name)
+    
+    def disable(self, name: str):
+        """Leave a shard out of searches; its worker keeps the index for later."""
+        self.shards[name]["enabled"] = False
+    
+    def status(self) -> List[Dict]:
+        return [
+            {k: v for k, v in shard.items() if k != "executor"}
+            for shard in self.shards.values()
+        ]
+    
+    def _search(self, query: str, top_k: int, include_docs: bool) -> List[Dict]:
+        pending = [
+            (name, shard["executor"].submit(_search_shard, name, query, top_k))
+            for name, shard in self.shards.items()
+            if shard["enabled"]
+        ]
+        
+        results = []
+        for name, future in pending:
+            try:
+                results.extend(future.result())
+            except BrokenProcessPool:
+                self.shards[name]["enabled"] = False
+                print(f"⚠️  Worker for shard {name} died; shard disabled")
+        
+        if include_docs:
+            results.extend(normalize_scores(self.search_docs(query, top_k)))
+        
+        results.sort(key=lambda x: x['score'], reverse=True)
+        return results[:top_k]
+    
+    def grep(self, pattern: str, literal: bool = False, ignore_case: bool = False,
+             max_results: int = 20, context_lines: int = 2) -> List[Dict]:
+        """Grep every enabled shard in parallel; results are grouped by shard."""
+        re.compile(re.escape(pattern) if literal else pattern)  # fail fast on a bad regex
+        pending = [
+            (name, shard["executor"].submit(_grep_shard, name, pattern, literal,
+                                            ignore_case, max_results, context_lines))
+            for name, shard in self.shards.items()
+            if shard["enabled"]
+        ]
+        
+        results = []
+        for name, future in pending:
+            try:
+                results.extend(future.result())
+            except BrokenProcessPool:
+                self.shards[name]["enabled"] = False
+                print(f"⚠️  Worker for shard {name} died; shard disabled")
+        return results[:max_results]
+    
+    def close(self):
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,244 @@
+"""
+Symbol Index - Definitions, imports and references for exact identifier lookup
+Python is parsed with ast; other languages use a lightweight regex tokenizer
+"""
+
+import ast
+import re
+from collections import defaultdict
+from typing import Dict, List, Set
+
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_CALL = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+_DOTTED = re.compile(r"[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*")
+_BACKTICKED = re.compile(r"`([^`]+)`")
+
+# (kind, pattern with the name in group "name") per language
+_DEFINITION_PATTERNS = {
+    "js": [
+        ("function", r"^\s*(export\s+)?(default\s+)?(async\s+)?function\s*\*?\s*(?P<name>\w+)"),
+        ("class", r"^\s*(export\s+)?(default\s+)?class\s+(?P<name>\w+)"),
+        ("function", r"^\s*(export\s+)?(const|let|var)\s+(?P<name>\w+)\s*=\s*(async\s+)?(function|\([^)]*\)\s*=>|\w+\s*=>)"),
+    ],
+    "java": [
+        ("class", r"^\s*(public|private|protected|abstract|final|static|\s)*(class|interface|enum|record)\s+(?P<name>\w+)"),
+        ("function", r"^\s*(public|private|protected|static|final|synchronized|abstract|\s)*[\w<>\[\],.? ]+\s+(?P<name>\w+)\s*\([^;]*\)\s*(throws [\w., ]+)?\s*\{"),
+    ],
+    "go": [
+        ("function", r"^\s*func\s+(\([^)]*\)\s*)?(?P<name>\w+)\s*[\[(]"),
+        ("class", r"^\s*type\s+(?P<name>\w+)\s+(struct|interface)"),
+    ],
+    "rs": [
+        ("function", r"^\s*(pub(\([^)]*\))?\s+)?(async\s+)?(unsafe\s+)?fn\s+(?P<name>\w+)"),
+        ("class", r"^\s*(pub(\([^)]*\))?\s+)?(struct|enum|trait|impl)\s+(?P<name>\w+)"),
+    ],
+    "cpp": [
+        ("class", r"^\s*(class|struct)\s+(?P<name>\w+)\s*[:{]?"),
+        ("function", r"^\s*[\w:<>*&\s]+?\b(?P<name>\w+)\s*\([^;]*\)\s*(const)?\s*\{?\s*$"),
+    ],
+}
+_DEFINITION_PATTERNS["ts"] = _DEFINITION_PATTERNS["js"] + [
+    ("class", r"^\s*(export\s+)?(interface|type|enum)\s+(?P<name>\w+)"),
+]
+_DEFINITION_PATTERNS["c"] = _DEFINITION_PATTERNS["cpp"]
+
+_IMPORT_PATTERNS = {
+    "js": r"^\s*import\s+(?P<names>.+?)\s+from\s",
+    "ts": r"^\s*import\s+(?P<names>.+?)\s+from\s",
+    "java": r"^\s*import\s+(static\s+)?(?P<names>[\w.]+)",
+    "go": r'^\s*(import\s+)?(\w+\s+)?"(?P<names>[\w./-]+)"',
+    "rs": r"^\s*use\s+(?P<names>[\w:{}, *]+);",
+    "cpp": r'^\s*#\s*include\s*[<"](?P<names>[\w./]+)[>"]',
+    "c": r'^\s*#\s*include\s*[<"](?P<names>[\w./]+)[>"]',
+}
+
+_KEYWORDS = {
+    "if", "for", "while", "switch", "catch", "return", "sizeof", "new", "delete",
+    "print", "len", "range", "super", "self", "this", "function", "typeof",
+}
+
+_MAX_BRACE_LINES = 80
+
+
+def identifier_tokens(query: str) -> List[str]:
+    """
+    Tokens in a query that look like code identifiers rather than prose:
+    anything in backticks, snake_case, camelCase/PascalCase or dotted names.
+    """
+    tokens = []
+    for span in _BACKTICKED.findall(query):
+        tokens.extend(_DOTTED.findall(span))
+    for token in _DOTTED.findall(query):
+        if "_" in token or "." in token or any(c.isupper() for c in token[1:]):
+            tokens.append(token)
+    expanded = []
+    for token in tokens:
+        expanded.append(token)
+        if "." in token:
+            parts = token.split(".")
+            expanded.append(".".join(parts[-2:]))
+            expanded.append(parts[-1])
+    return list(dict.fromkeys(expanded))
+
+
+class SymbolIndex:
+    """Maps identifiers to their definitions and records what each one uses."""
+    
+    def __init__(self):
+        # name -> list of definitions; each is a dict with path, kind, lines, deps
+        self.definitions = defaultdict(list)
+        self.imports = defaultdict(set)     # path -> imported names
+        self.references = defaultdict(set)  # name -> paths that call it
+    
+    def __len__(self):
+        return sum(len(defs) for defs in self.definitions.values())
+    
+    def add_file(self, path: str, content: str, language: str):
+        if language == "py":
+            try:
+                self._add_python(path, content)
+                return
+            except SyntaxError:
+                pass
+        self._add_generic(path, content, language)
+    
+    def _define(self, name: str, path: str, kind: str, start: int, end: int,
+                lines: List[str], deps: Set[str]):
+        self.definitions[name].append({
+            "name": name,
+            "path": path,
+            "kind": kind,
+            "start": start,
+            "end": end,
+            "content": "\n".join(lines[start - 1:end]),
+            "deps": deps - {name},
+        })
+    
+    def _add_python(self, path: str, content: str):
+        tree = ast.parse(content)
+        lines = content.splitlines()
+        
+        def names_used(node) -> Set[str]:
+            used = set()
+            for sub in ast.walk(node):
+                if isinstance(sub, ast.Call):
+                    func = sub.func
+                    if isinstance(func, ast.Name):
+                        used.add(func.id)
+                    elif isinstance(func, ast.Attribute):
+                        used.add(func.attr)
+                elif isinstance(sub, ast.Name) and isinstance(sub.ctx, ast.Load):
+                    used.add(sub.id)
+            return used
+        
+        def visit(node, prefix=""):
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    kind = "class" if isinstance(child, ast.ClassDef) else "function"
+                    deps = names_used(child)
+                    start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                    self._define(child.name, path, kind, start, child.end_lineno, lines, deps)
+                    if prefix:
+                        self._define(f"{prefix}.{child.name}", path, kind, start,
+                                     child.end_lineno, lines, deps)
+                    visit(child, child.name if kind == "class" else prefix)
+                elif isinstance(child, (ast.Import, ast.ImportFrom)):
+                    for alias in child.names:
+                        self.imports[path].add((alias.asname or alias.name).split(".")[0])
+                elif isinstance(child, ast.Assign) and node is tree:
+                    for target in child.targets:
+                        if isinstance(target, ast.Name) and target.id.isupper():
+                            self._define(target.id, path, "constant", child.lineno,
+                                         child.end_lineno, lines, names_used(child.value))
+        
+        visit(tree)
+        for name in {
+            n.func.id if isinstance(n.func, ast.Name) else n.func.attr
+            for n in ast.walk(tree)
+            if isinstance(n, ast.Call) and isinstance(n.func, (ast.Name, ast.Attribute))
+        }:
+            self.references[name].add(path)
+    
+    def _add_generic(self, path: str, content: str, language: str):
+        lines = content.splitlines()
+        patterns = [(kind, re.compile(p)) for kind, p in _DEFINITION_PATTERNS.get(language, [])]
+        import_pattern = re.compile(_IMPORT_PATTERNS[language]) if language in _IMPORT_PATTERNS else None
+        
+        for i, line in enumerate(lines):
+            if import_pattern:
+                match = import_pattern.match(line)
+                if match:
+                    for name in _IDENTIFIER.findall(match.group("names")):
+                        self.imports[path].add(name)
+                    continue
+            
+            for kind, pattern in patterns:
+                match = pattern.match(line)
+                if not match or match.group("name") in _KEYWORDS:
+                    continue
+                end = self._brace_end(lines, i)
+                body = "\n".join(lines[i:end])
+                deps = {m for m in _CALL.findall(body) if m not in _KEYWORDS}
+                self._define(match.group("name"), path, kind, i + 1, end, lines, deps)
+                break
+        
+        for name in set(_CALL.findall(content)) - _KEYWORDS:
+            self.references[name].add(path)
+    
+    @staticmethod
+    def _brace_end(lines: List[str], start: int) -> int:
+        """1-based last line of the block opened at or after lines[start]."""
+        depth, opened = 0, False
+        for j in range(start, min(len(lines), start + _MAX_BRACE_LINES)):
+            depth += lines[j].count("{") - lines[j].count("}")
+            opened = opened or "{" in lines[j]
+            if opened and depth <= 0:
+                return j + 1
+            if not opened and j > start + 2:
+                break
+        return min(len(lines), start + (_MAX_BRACE_LINES if opened else 1))
+    
+    def lookup(self, name: str) -> List[Dict]:
+        """Definitions of an exact identifier (dict lookup)."""
+        return self.definitions.get(name, [])
+    
+    def resolve(self, query: str, with_dependencies: bool = True,
+                max_dependencies: int = 4) -> List[Dict]:
+        """
+        Definitions for identifiers mentioned in the query, then the
+        definitions they directly depend on.
+        """
+        found, seen = [], set()
+        for token in identifier_tokens(query):
+            for definition in self.lookup(token):
+                key = (definition["path"], definition["start"])
+                if key not in seen:
+                    seen.add(key)
+                    found.append(dict(definition, relation="definition"))
+        
+        if with_dependencies:
+            for definition in list(found):
+                for dep_def in self._dependencies(definition)[:max_dependencies]:
+                    key = (dep_def["path"], dep_def["start"])
+                    if key not in seen:
+                        seen.add(key)
+                        found.append(dict(dep_def, relation=f"used by {definition['name']}"))
+        return found
+    
+    def _dependencies(self, definition: Dict) -> List[Dict]:
+        """Definitions a definition uses, limited to its own file and its imports."""
+        path = definition["path"]
+        imported = self.imports.get(path, set())
+        local, external = [], []
+        for dep in sorted(definition["deps"]):
+            for dep_def in self.lookup(dep):
+                if dep_def["path"] == path:
+                    local.append(dep_def)
+                elif dep in imported or _module_name(dep_def["path"]) in imported:
+                    external.append(dep_def)
+        return local + external
+
+
+def _module_name(path: str) -> str:
+    return re.split(r"[\\/]", path)[-1].rsplit(".", 1)[0]
@@ -0,0 +1,255 @@
+"""
+Telemetry - Lightweight per-stage timings and counters
+Exports JSON lines and Prometheus text, keeps rolling percentiles for /stats
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Optional
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process in MB, if the OS exposes it."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS reports bytes
+        return peak / (1024 ** 2) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1024 ** 2)
+    except ImportError:
+        return None
+
+
+def current_rss_mb() -> Optional[float]:
+    """Current resident memory of this process in MB, if the OS exposes it."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 ** 2)
+    except ImportError:
+        pass
+
+    try:
+        import os
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 ** 2)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Telemetry:
+    """Collect timings, counters and gauges with rolling windows."""
+
+    def __init__(self, window: int = 512):
+        self.window = window
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.sink = None
+        # Set by the profiler while capturing: name -> context manager
+        # (e.g. torch.profiler.record_function) that labels the timed block
+        self.annotate = None
+
+    def enable_jsonl(self, path: str):
+        """Append every recorded event to a JSON lines file."""
+        self.sink = open(path, 'a', encoding='utf-8', buffering=1)
+
+    def _emit(self, kind: str, name: str, value: float):
+        if self.sink is not None:
+            self.sink.write(json.dumps({
+                'ts': time.time(), 'kind': kind, 'name': name, 'value': value
+            }) + '\n')
+
+    def observe(self, name: str, value: float):
+        """Record one sample (seconds, tokens/sec, ...)."""
+        with self.lock:
+            self.samples[name].append(value)
+            self._emit('sample', name, value)
+
+    def incr(self, name: str, amount: float = 1):
+        """Increase a monotonic counter."""
+        with self.lock:
+            self.counters[name] += amount
+            self._emit('counter', name, amount)
+
+    def gauge(self, name: str, value: float):
+        """Set a point-in-time value."""
+        with self.lock:
+            self.gauges[name] = value
+            self._emit('gauge', name, value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Time a block and record its duration in seconds."""
+        start = time.perf_counter()
+        try:
+            if self.annotate is None:
+                yield
+            else:
+                with self.annotate(name):
+                    yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def record_memory(self):
+        peak = peak_rss_mb()
+        if peak is not None:
+            self.gauge('process.peak_rss_mb', peak)
+
+    def percentiles(self, name: str, points=(50, 90, 99)) -> Dict[int, float]:
+        with self.lock:
+            values = list(self.samples.get(name, ()))
+        return _percentiles(values, points)
+
+    def snapshot(self):
+        """Copies of (samples, counters, gauges) taken under the lock, safe to format."""
+        with self.lock:
+            samples = {name: list(values) for name, values in self.samples.items()}
+            return samples, dict(self.counters), dict(self.gauges)
+
+    def summary(self) -> str:
+        """Human-readable table of rolling percentiles, counters and gauges."""
+        samples, counters, gauges = self.snapshot()
+        lines = [f"{'stage':<28} {'n':>5} {'p50':>10} {'p90':>10} {'p99':>10}"]
+        for name in sorted(samples):
+            pct = _percentiles(samples[name])
+            if not pct:
+                continue
+            lines.append(
+                f"{name:<28} {len(samples[name]):>5} "
+                f"{pct[50]:>10.4f} {pct[90]:>10.4f} {pct[99]:>10.4f}"
+            )
+        for name in sorted(counters):
+            lines.append(f"{name:<28} {counters[name]:>16.0f}")
+        for name in sorted(gauges):
+            lines.append(f"{name:<28} {gauges[name]:>16.1f}")
+        return '\n'.join(lines)
+
+    def to_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        samples, counters, gauges = self.snapshot()
+        out = []
+        for name in sorted(samples):
+            metric = _metric_name(name)
+            values = samples[name]
+            out.append(f"# TYPE {metric} summary")
+            for p, v in _percentiles(values).items():
+                out.append(f'{metric}{{quantile="{p / 100}"}} {v}')
+            out.append(f"{metric}_sum {sum(values)}")
+            out.append(f"{metric}_count {len(values)}")
+        for name in sorted(counters):
+            metric = _metric_name(name) + '_total'
+            out.append(f"# TYPE {metric} counter")
+            out.append(f"{metric} {counters[name]}")
+        for name in sorted(gauges):
+            metric = _metric_name(name)
+            out.append(f"# TYPE {metric} gauge")
+            out.append(f"{metric} {gauges[name]}")
+        return '\n'.join(out) + '\n'
+
+    def serve_prometheus(self, port: int, host: str = '127.0.0.1') -> HTTPServer:
+        """Serve /metrics from a daemon thread."""
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = telemetry.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _percentiles(values, points=(50, 90, 99)) -> Dict[int, float]:
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        p: values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+        for p in points
+    }
+
+
+def _metric_name(name: str) -> str:
+    return 'hybrid_llm_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+class GenerationTimer:
+    """
+    Stopping criterion that never stops, used to timestamp decoding.
+
+    generate() calls it once per step, so the first call marks the end of
+    prefill and the rest measure decode speed. For batched generation each
+    step produces batch_size tokens. With input_width (the prompt's padded
+    length) tokens are counted from the sequence length instead, which is
+    needed when a step can accept several tokens (prompt lookup decoding).
+    """
+
+    def __init__(self, telemetry: Telemetry, prompt_tokens: int, prefix: str = 'generate',
+                 batch_size: int = 1, input_width: Optional[int] = None):
+        self.telemetry = telemetry
+        self.prompt_tokens = prompt_tokens
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.input_width = input_width
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.first_width = None
+        self.width = None
+        self.steps = 0
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+            self.first_width = input_ids.shape[1]
+        self.width = input_ids.shape[1]
+        self.steps += 1
+        return input_ids.new_zeros(input_ids.shape[0]).bool()
+
+    @property
+    def new_tokens(self) -> int:
+        """Tokens generated per sequence so far."""
+        if self.input_width is None or self.width is None:
+            return self.steps
+        return self.width - self.input_width
+
+    def finish(self):
+        """Record prefill/decode metrics once generate() returns."""
+        end = time.perf_counter()
+        t = self.telemetry
+        t.observe(f'{self.prefix}.total_s', end - self.start)
+        t.incr(f'{self.prefix}.tokens_in', self.prompt_tokens)
+        t.incr(f'{self.prefix}.tokens_out', self.new_tokens * self.batch_size)
+        if self.first_token is not None:
+            prefill = self.first_token - self.start
+            t.observe(f'{self.prefix}.prefill_s', prefill)
+            if prefill > 0:
+                t.observe(f'{self.prefix}.prefill_tps', self.prompt_tokens / prefill)
+            decode = end - self.first_token
+            decoded = self.width - self.first_width if self.input_width is not None else self.steps - 1
+            if decoded > 0 and decode > 0:
+                t.observe(f'{self.prefix}.decode_tps', decoded * self.batch_size / decode)
+        t.record_memory()
+
+
+# Process-wide collector shared by all components
+telemetry = Telemetry()
@@ -0,0 +1,69 @@
+"""
+Regression tests for the context compressor's Python edits
+Run with: python -m pytest test_context_compressor.py
+"""
+
+import ast
+
+from context_compressor import ContextCompressor
+
+
+def compress(code: str, **settings) -> str:
+    compressor = ContextCompressor({"default": settings})
+    return compressor.compress(code, "py", query="unrelated words")
+
+
+def test_one_line_body_keeps_signature():
+    code = "def short(): return 1\n\ndef other():\n    return 2\n"
+    out = compress(code, elide_bodies=True)
+    assert "def short(): return 1" in out
+    assert "def other():\n    ..." in out
+    ast.parse(out)
+
+
+def test_one_line_docstring_and_statement_kept():
+    code = 'class A:\n    def f(self): """doc"""; return 2\n'
+    out = compress(code, elide_bodies=True, docstrings="strip")
+    assert 'def f(self): """doc"""; return 2' in out
+    ast.parse(out)
+
+
+def test_docstring_sharing_line_with_statement_kept():
+    code = 'def f():\n    """doc"""; return 2\n'
+    out = compress(code, docstrings="strip")
+    assert "return 2" in out
+    ast.parse(out)
+
+
+def test_multiline_body_is_elided():
+    code = 'def long():\n    """Summary.\n\n    Details.\n    """\n    x = 1\n    return x\n'
+    out = compress(code, elide_bodies=True)
+    assert out == "def long():\n    ..."
+
+
+def test_docstring_first_line():
+    code = 'def f():\n    """Summary.\n\n    Details.\n    """\n    return 1\n'
+    out = compress(code)
+    assert out == 'def f():\n    """Summary."""\n    return 1'
+
+
+def test_stopwords_do_not_keep_bodies():
+    code = "def unrelated(items):\n    for item in items:\n        print('and the', item)\n    return items\n"
+    compressor = ContextCompressor({"default": {"elide_bodies": True}})
+    out = compressor.compress(code, "py", query="write a function for the parser and the lexer")
+    assert out == "def unrelated(items):\n    ..."
+
+
+def test_query_word_keeps_body():
+    code = "def parse(text):\n    return text.split()\n"
+    compressor = ContextCompressor({"default": {"elide_bodies": True}})
+    out = compressor.compress(code, "py", query="fix the parse function")
+    assert "return text.split()" in out
+
+
+def test_docstring_first_line_with_quotes_stays_valid():
+    for first in ['Return "x"', 'Contains """ inside', 'Matches \\d+ digits']:
+        code = f"def f():\n    r'''{first}\n\n    More.\n    '''\n    return 1\n"
+        out = compress(code)
+        tree = ast.parse(out)
+        assert ast.get_docstring(tree.body[0]) == first
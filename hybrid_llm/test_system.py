@@ -69,18 +69,27 @@ def test_model_download():
     """Check if model needs to be downloaded."""
     print("\nChecking model cache...")
     
-    import os
-    cache_dir = Path.home() / ".cache" / "huggingface" / "hub"
-    
-    if cache_dir.exists():
-        models = list(cache_dir.glob("models--Qwen*"))
-        if models:
-            print(f"✅ Found {len(models)} Qwen model(s) in cache")
-            return True
-    
-    print("⚠️  No cached models found")
-    print("   First run will download ~6GB")
-    return True
+    from model_manifest import ModelManifest
+    manifest = ModelManifest()
+    models = manifest.cached_models()
+    
+    if not models:
+        print("⚠️  No cached models found")
+        print("   First run will download ~6GB")
+        return True
+    
+    # Stat-only check against the manifest; run check_models.py to re-hash
+    ok = True
+    for name in models:
+        entry = manifest.check(name, verify_hashes=False)
+        if entry['status'] == 'incomplete':
+            ok = False
+            print(f"❌ {name}: {', '.join(entry['problems'])}")
+        else:
+            print(f"✅ {name} ({entry['status']})")
+    manifest.save()
+    
+    return ok
 
 
 def main():
@@ -0,0 +1,194 @@
+"""
+Trigram Index - Fast literal and regex search over indexed code
+Posting lists of lowercase trigrams narrow the candidate files, which are
+then verified with the real regex (the codesearch/zoekt approach)
+"""
+
+import base64
+import json
+import os
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Union
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+
+
+def trigrams(text: str) -> Set[str]:
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _required_literals(parsed) -> List[str]:
+    """Literal runs every match must contain; empty if none can be proven."""
+    runs, current = [], []
+    for op, arg in parsed:
+        if op == sre_parse.LITERAL:
+            current.append(chr(arg))
+            continue
+        runs.append("".join(current))
+        current = []
+        if op == sre_parse.SUBPATTERN:
+            runs.extend(_required_literals(arg[-1]))
+        elif op in _REPEATS and arg[0] >= 1:
+            runs.extend(_required_literals(arg[2]))
+        elif op == sre_parse.BRANCH:
+            continue  # any one alternative may match; nothing is required
+    runs.append("".join(current))
+    return [run for run in runs if len(run) >= 3]
+
+
+def query_trigrams(pattern: str) -> Set[str]:
+    """Trigrams any match of the regex must contain (empty set = scan everything)."""
+    try:
+        literals = _required_literals(sre_parse.parse(pattern))
+    except (re.error, TypeError, ValueError):
+        return set()
+    return set().union(*(trigrams(run) for run in literals))
+
+
+def _encode_ids(ids: List[int]) -> str:
+    """Ascending ids as base64 varints of the gaps between them."""
+    out, previous = bytearray(), 0
+    for doc_id in ids:
+        gap, previous = doc_id - previous, doc_id
+        while gap >= 0x80:
+            out.append(gap & 0x7F | 0x80)
+            gap >>= 7
+        out.append(gap)
+    return base64.b64encode(bytes(out)).decode('ascii')
+
+
+def _decode_ids(text: str) -> List[int]:
+    ids, previous, value, shift = [], 0, 0, 0
+    for byte in base64.b64decode(text):
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += value
+        ids.append(previous)
+        value, shift = 0, 0
+    return ids
+
+
+class TrigramIndex:
+    """
+    Lowercase trigram -> ids of the files containing it.
+
+    update() re-indexes only paths whose fingerprint changed: their old ids
+    become tombstones that queries skip, and the index is rebuilt once they
+    outnumber live files. Postings are saved as base64 delta varints and
+    decoded on first use.
+    """
+    
+    FORMAT = 2
+    
+    def __init__(self):
+        self.paths: List[Optional[str]] = []  # doc id -> path, None once removed
+        self.ids: Dict[str, int] = {}
+        self.fingerprints: Dict[str, list] = {}
+        self.postings: Dict[str, Union[str, List[int]]] = {}  # str = still encoded
+    
+    @classmethod
+    def build(cls, code_index: Dict[str, Dict],
+              read: Callable[[str], Optional[str]]) -> "TrigramIndex":
+        """
+        Index every entry, collapsed copies included.
+
+        read(path) returns a file's text (from the entry, or from disk for a
+        copy that keeps no content); files it returns None for match nothing.
+        """
+        index = cls()
+        index.update(code_index, read)
+        return index
+    
+    @staticmethod
+    def fingerprint(code_index: Dict[str, Dict]) -> Dict[str, list]:
+        return {path: [data.get('mtime'), data.get('bytes')] for path, data in code_index.items()}
+    
+    def update(self, code_index: Dict[str, Dict], read: Callable[[str], Optional[str]]) -> int:
+        """Bring the index in line with code_index; returns the number of paths re-indexed or dropped."""
+        current = self.fingerprint(code_index)
+        stale = [path for path, fp in self.fingerprints.items() if current.get(path) != fp]
+        for path in stale:
+            self.paths[self.ids.pop(path)] = None
+            del self.fingerprints[path]
+        
+        if len(self.paths) > 2 * len(self.ids):
+            # Mostly tombstones: start over rather than keep skipping them
+            self.paths, self.ids, self.fingerprints, self.postings = [], {}, {}, {}
+        
+        added = [path for path in current if path not in self.fingerprints]
+        for path in added:
+            doc_id = len(self.paths)
+            self.paths.append(path)
+            self.ids[path] = doc_id
+            self.fingerprints[path] = current[path]
+            content = read(path)
+            for trigram in trigrams(content or ''):
+                self._posting(trigram).append(doc_id)
+        return len(stale) + len(added)
+    
+    def _posting(self, trigram: str) -> List[int]:
+        posting = self.postings.get(trigram)
+        if posting is None:
+            posting = self.postings[trigram] = []
+        elif isinstance(posting, str):
+            posting = self.postings[trigram] = _decode_ids(posting)
+        return posting
+    
+    @classmethod
+    def load(cls, path: Path) -> Optional["TrigramIndex"]:
+        """The saved index, or None if missing or in an older format."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get('format') != cls.FORMAT:
+            return None
+        index = cls()
+        index.paths = saved['paths']
+        index.ids = {p: i for i, p in enumerate(index.paths) if p is not None}
+        index.fingerprints = saved['fingerprints']
+        index.postings = saved['postings']
+        return index
+    
+    def save(self, path: Path):
+        """Write the index atomically."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        postings = {
+            trigram: posting if isinstance(posting, str) else _encode_ids(posting)
+            for trigram, posting in self.postings.items()
+        }
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'format': self.FORMAT, 'paths': self.paths,
+                       'fingerprints': self.fingerprints, 'postings': postings}, f)
+        os.replace(tmp_path, path)
+    
+    def candidates(self, pattern: str) -> List[str]:
+        """Files that may match the regex; rarest trigrams are intersected first."""
+        required = query_trigrams(pattern)
+        if not required:
+            return list(self.ids)
+        
+        if any(t not in self.postings for t in required):
+            return []
+        postings = sorted((self._posting(t) for t in required), key=len)
+        ids = set(postings[0])
+        for posting in postings[1:]:
+            if not ids:
+                break
+            ids.intersection_update(posting)
+        return [self.paths[i] for i in sorted(ids) if self.paths[i] is not None]
+    
+    def __len__(self):
+        return len(self.postings)
@@ -3,15 +3,194 @@ Web Search Tool - For internet-assisted code generation
 Only used when explicitly requested
 """
 
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import List, Dict, Iterable
+from urllib.parse import parse_qs, urlparse
+
 import requests
 from bs4 import BeautifulSoup
-from typing import List, Dict
+from telemetry import telemetry
+
+try:
+    from lxml import etree
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+
+# Tags whose text never belongs in the extracted page content
+SKIP_TAGS = {'script', 'style', 'nav', 'noscript', 'svg', 'template', 'iframe'}
+
+# Tags that start a new line in the extracted text
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'li', 'ul', 'ol', 'pre', 'tr', 'table', 'section',
+    'article', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'dd', 'dt',
+}
+
+_WHITESPACE = re.compile(r'[ \t\r\f\v]+')
+
+
+class TextCollector:
+    """Accumulate visible text until a character budget is reached."""
+
+    def __init__(self, max_chars: int = 5000):
+        self.max_chars = max_chars
+        self.skip_depth = 0
+        self.parts = []
+        self.line = []
+        self.pending = 0
+        self.length = 0
+        self.done = False
+
+    def start(self, tag: str):
+        tag = tag.lower()
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.newline()
+
+    def end(self, tag: str):
+        tag = tag.lower()
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self.newline()
+
+    def data(self, text: str):
+        if self.skip_depth or self.done:
+            return
+        lines = text.split('\n')
+        for i, segment in enumerate(lines):
+            if i:
+                self.newline()
+            if segment:
+                self.line.append(segment)
+                self.pending += len(segment)
+        if self.length + self.pending >= self.max_chars:
+            self.newline()
+
+    def newline(self):
+        """Flush the current line into the output."""
+        line = _WHITESPACE.sub(' ', ''.join(self.line)).strip()
+        self.line = []
+        self.pending = 0
+        if not line or self.done:
+            return
+        self.parts.append(line)
+        self.length += len(line) + 1
+        if self.length >= self.max_chars:
+            self.done = True
+
+    def text(self) -> str:
+        self.newline()
+        return '\n'.join(self.parts)[:self.max_chars]
+
+
+class _StdlibParser(HTMLParser):
+    """Feed stdlib HTMLParser events into a TextCollector."""
+
+    def __init__(self, collector: TextCollector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag.lower() in BLOCK_TAGS:
+            self.collector.newline()
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+class _LxmlTarget:
+    """lxml parser target forwarding events into a TextCollector."""
+
+    def __init__(self, collector: TextCollector):
+        self.collector = collector
+
+    def start(self, tag, attrib):
+        self.collector.start(tag)
+
+    def end(self, tag):
+        self.collector.end(tag)
+
+    def data(self, data):
+        self.collector.data(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return None
+
+
+def extract_text_stream(
+    chunks: Iterable[str],
+    max_chars: int = 5000,
+    use_lxml: bool = True
+) -> str:
+    """
+    Extract visible text from HTML delivered in chunks.
+    
+    Parsing stops as soon as max_chars of text have been collected, so
+    the rest of the document is never read. Uses lxml's incremental
+    parser when installed, otherwise the stdlib HTMLParser.
+    """
+    collector = TextCollector(max_chars)
+    if use_lxml and HAS_LXML:
+        parser = etree.HTMLParser(target=_LxmlTarget(collector))
+    else:
+        parser = _StdlibParser(collector)
+    
+    for chunk in chunks:
+        parser.feed(chunk)
+        if collector.done:
+            break
+    else:
+        try:
+            parser.close()
+        except Exception:
+            pass
+    
+    return collector.text()
+
+
+def resolve_result_url(href: str) -> str:
+    """
+    Real target of a DuckDuckGo result link.
+    
+    The HTML endpoint links results through protocol-relative redirects
+    (//duckduckgo.com/l/?uddg=<encoded url>); the target is in uddg.
+    """
+    if href.startswith('//'):
+        href = 'https:' + href
+    parsed = urlparse(href)
+    if parsed.netloc.endswith('duckduckgo.com'):
+        target = parse_qs(parsed.query).get('uddg')
+        if target:
+            return target[0]
+    return href
 
 
 class WebSearchTool:
     """Simple web search for documentation and examples."""
     
-    def __init__(self):
+    def __init__(self, max_page_bytes: int = 2 * 1024 * 1024, doc_store=None):
+        """
+        Args:
+            max_page_bytes: Stop reading a page body after this many bytes
+            doc_store: Optional CodebaseRAG; fetched pages are added to its
+                docs partition for offline reuse
+        """
+        self.max_page_bytes = max_page_bytes
+        self.doc_store = doc_store
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
@@ -19,6 +198,11 @@ class WebSearchTool:
     
     def search_duckduckgo(self, query: str, max_results: int = 5) -> List[Dict]:
         """Search using DuckDuckGo (no API key needed)."""
+        telemetry.incr('web.searches')
+        with telemetry.timer('web.search'):
+            return self._search_duckduckgo(query, max_results)
+    
+    def _search_duckduckgo(self, query: str, max_results: int) -> List[Dict]:
         try:
             url = f"https://html.duckduckgo.com/html/?q={query}"
             response = self.session.get(url, timeout=10)
@@ -32,7 +216,7 @@ class WebSearchTool:
                 if title_elem:
                     results.append({
                         'title': title_elem.get_text(strip=True),
-                        'url': title_elem.get('href', ''),
+                        'url': resolve_result_url(title_elem.get('href', '')),
                         'snippet': snippet_elem.get_text(strip=True) if snippet_elem else ''
                     })
             
@@ -41,28 +225,49 @@ class WebSearchTool:
             print(f"Search error: {e}")
             return []
     
-    def fetch_page(self, url: str) -> str:
-        """Fetch and extract text from a webpage."""
+    def fetch_page(self, url: str, max_chars: int = 5000) -> str:
+        """
+        Fetch and extract text from a webpage.
+        
+        The body is streamed and parsed incrementally; reading stops once
+        max_chars of text are collected or max_page_bytes have been read.
+        """
         try:
-            response = self.session.get(url, timeout=10)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(['script', 'style']):
-                script.decompose()
-            
-            # Get text
-            text = soup.get_text()
-            
-            # Clean up
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk)
-            
-            return text[:5000]  # Limit to 5000 chars
+            with telemetry.timer('web.fetch'), \
+                    self.session.get(url, timeout=10, stream=True) as response:
+                text = extract_text_stream(
+                    self._iter_text(response),
+                    max_chars=max_chars
+                )
         except Exception as e:
+            telemetry.incr('web.fetch_errors')
             print(f"Fetch error: {e}")
             return ""
+        
+        if self.doc_store is not None and text:
+            self.doc_store.add_document(url, text)
+        
+        return text
+    
+    def _iter_text(self, response, chunk_size: int = 16384):
+        """Decode a streamed response body, capped at max_page_bytes."""
+        encoding = response.encoding or 'utf-8'
+        try:
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        
+        remaining = self.max_page_bytes
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            telemetry.incr('web.bytes_read', len(chunk))
+            yield decoder.decode(chunk)
+            if remaining <= 0:
+                return
+        yield decoder.decode(b'', final=True)
     
     def search_docs(self, library: str, topic: str) -> str:
         """Search for library documentation."""
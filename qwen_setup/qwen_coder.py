@@ -4,10 +4,16 @@ Maximizes accuracy through careful prompting and inference settings
 """
 
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig, StoppingCriteriaList
 import warnings
 warnings.filterwarnings("ignore")
 
+try:
+    # Shared with hybrid_llm when both directories are on the path
+    from telemetry import telemetry, GenerationTimer
+except ImportError:
+    telemetry = None
+
 
 class QwenCoder:
     def __init__(self, model_name="Qwen/Qwen2.5-Coder-1.5B-Instruct"):
@@ -81,6 +87,12 @@ class QwenCoder:
         
         inputs = self.tokenizer(text, return_tensors="pt").to(self.model.device)
         
+        stopping_criteria = StoppingCriteriaList()
+        gen_timer = None
+        if telemetry is not None:
+            gen_timer = GenerationTimer(telemetry, inputs.input_ids.shape[1], prefix='qwen.generate')
+            stopping_criteria.append(gen_timer)
+        
         with torch.no_grad():
             outputs = self.model.generate(
                 **inputs,
@@ -91,8 +103,12 @@ class QwenCoder:
                 repetition_penalty=repetition_penalty,
                 do_sample=True,
                 pad_token_id=self.tokenizer.eos_token_id,
+                stopping_criteria=stopping_criteria,
             )
         
+        if gen_timer is not None:
+            gen_timer.finish()
+        
         response = self.tokenizer.decode(
             outputs[0][inputs.input_ids.shape[1]:],
             skip_special_tokens=True